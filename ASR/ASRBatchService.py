@@ -0,0 +1,36 @@
+import logging
+import time
+
+from ASR.ASRService import ASRService
+from utils.MicroBatcher import MicroBatcher
+
+
+class ASRBatchService(ASRService):
+    """ASRService that batches utterances from concurrent sessions.
+
+    ``infer`` has the same signature as ``ASRService.infer`` and blocks the
+    calling session; under load the utterances of several sessions share one
+    padded ONNX run.
+    """
+
+    def __init__(self, config_path, max_batch=None, window=0.02, min_confidence=0.0):
+        super().__init__(config_path, min_confidence)
+        max_batch = max_batch or self.paraformer.batch_size
+        logging.info('ASR batching: up to %i utterances, window %.0f ms' % (max_batch, window * 1000))
+        self.batcher = MicroBatcher(self.infer_batch, max_batch=max_batch, window=window, name='asr-batch')
+
+    def infer_batch(self, wav_contents):
+        stime = time.time()
+        # a batch the model rejects (silence, noise) is retried one by one inside,
+        # so every session gets a result
+        result = self.paraformer(wav_contents, detailed=True)
+        logging.info('ASR Result: %s. batch of %i, time used %.2f.' % ([r.text for r in result], len(wav_contents), time.time() - stime))
+        return result
+
+    def infer(self, wav_content, fs=16000):
+        # decode and resample on the caller's thread, the batch worker only runs the model
+        waveform = self.paraformer.load_data(wav_content, fs)[0]
+        if self.paraformer.is_long(waveform):
+            # already runs its segments as batches, keep it out of the shared ones
+            return self.paraformer.transcribe_long(waveform)
+        return self.batcher.submit(waveform)
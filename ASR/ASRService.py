@@ -1,19 +1,58 @@
 import logging
+import os
 import time
 
+from onnxruntime import InferenceSession
+
 from ASR.rapid_paraformer import RapidParaformer
+from utils import OnnxGraphCache, OnnxQuantize
+
+
+def load_session(model_conf, providers, sess_options):
+    """Session factory for RapidParaformer: Model.precision picks fp32 or int8,
+    Model.optimized_cache loads through the optimized-graph cache."""
+    model_path = OnnxQuantize.model_for_precision(model_conf['model_path'], model_conf.get('precision', 'fp32'))
+    if not os.path.isfile(model_path):
+        raise FileNotFoundError('%s does not exist.' % model_path)
+    if model_conf.get('optimized_cache', False):
+        # the first session writes the optimized graph, the others load it
+        return OnnxGraphCache.load_session(model_path, providers, sess_options)
+    return InferenceSession(model_path, sess_options=sess_options, providers=providers)
 
 
 class ASRService():
-    def __init__(self, config_path):
+    def __init__(self, config_path, min_confidence=0.0):
         logging.info('Initializing ASR Service...')
-        self.paraformer = RapidParaformer(config_path)
+        self.paraformer = RapidParaformer(config_path, session_factory=load_session)
+        self.min_confidence = min_confidence
+
+    def infer(self, wav_content, fs=16000):
+        """Transcribe one recording, returns an ASRResult (text, score, duration, voiced_ratio)."""
+        stime = time.time()
+        waveform = self.paraformer.load_data(wav_content, fs)[0]
+        if self.paraformer.is_long(waveform):
+            result = self.paraformer.transcribe_long(waveform)
+        else:
+            result = self.paraformer(waveform, detailed=True)[0]
+        logging.info('ASR Result: %s. confidence %.2f, time used %.2f.' % (result.text, result.confidence, time.time() - stime))
+        return result
+
+    def accepts(self, result):
+        """Whether an utterance is worth a reply: some text, recognized with enough confidence."""
+        if not result.text.strip():
+            logging.info('ASR: empty utterance (%.1fs, %.0f%% voiced), skipping reply.' % (result.duration, result.voiced_ratio * 100))
+            return False
+        if result.confidence < self.min_confidence:
+            logging.info('ASR: "%s" below confidence threshold (%.2f < %.2f), skipping reply.' % (result.text, result.confidence, self.min_confidence))
+            return False
+        return True
 
-    def infer(self, wav_path):
+    def infer_many(self, wav_contents):
+        """Transcribe many recordings at once, batched by length; results keep the input order."""
         stime = time.time()
-        result = self.paraformer(wav_path)
-        logging.info('ASR Result: %s. time used %.2f.' % (result, time.time() - stime))
-        return result[0]
+        result = self.paraformer(list(wav_contents), sort_by_length=True)
+        logging.info('ASR transcribed %i files. time used %.2f.' % (len(result), time.time() - stime))
+        return result
 
 if __name__ == '__main__':
     config_path = 'ASR/resources/config.yaml'
@@ -23,4 +62,4 @@ if __name__ == '__main__':
     # print(wav_path)
     wav_path = 'ASR/test_wavs/0478_00017.wav'
     result = service.infer(wav_path)
-    print(result)
\ No newline at end of file
+    print(result.text)
\ No newline at end of file
@@ -2,3 +2,4 @@
 # @Author: SWHL
 # @Contact: liekkaskono@163.com
 from .rapid_paraformer import RapidParaformer
+from .utils import ASRResult
@@ -1,3 +1,6 @@
+import functools
+import math
+
 import numpy as np
 from scipy.fftpack import dct
 
@@ -99,9 +102,35 @@ def process_window(window, dither, remove_dc_offset, preemphasis_coefficient, wi
     return window, log_energy
 
 
-def extract_window(waveform, blackman_coeff, dither, window_size, window_shift,
-                   preemphasis_coefficient, raw_energy, remove_dc_offset,
-                   snip_edges, window_type, dtype):
+def process_windows(frames, dither, remove_dc_offset, preemphasis_coefficient, window_function, raw_energy):
+    """ Batched process_window over all frames of an utterance, in place.
+
+    :param frames: Frames matrix of shape (num_frames, window_size), C-contiguous.
+    :return: Processed frames and per-frame log energy.
+    """
+    if dither != 0.0:
+        # row-major draw order equals the per-frame loop, so a seeded run gives the same noise
+        frames = func_dither(frames, dither)
+    if remove_dc_offset:
+        frames -= frames.mean(axis=1, keepdims=True)
+    if raw_energy:
+        log_energy = func_log_energy_frames(frames)
+    if preemphasis_coefficient != 0.0:
+        assert 0 < preemphasis_coefficient <= 1
+        frames[:, 1:] -= preemphasis_coefficient * frames[:, :-1]
+        frames[:, 0] -= preemphasis_coefficient * frames[:, 0]
+    frames *= window_function
+    if not raw_energy:
+        log_energy = func_log_energy_frames(frames)
+    return frames, log_energy
+
+
+def func_log_energy_frames(frames):
+    energy = np.einsum('ij,ij->i', frames, frames)
+    return np.log(energy.clip(min=np.finfo(frames.dtype).eps))
+
+
+def _frame_waveform(waveform, window_size, window_shift, snip_edges):
     num_samples = len(waveform)
     num_frames = func_num_frames(num_samples, window_size, window_shift, snip_edges)
     num_samples_ = (num_frames - 1) * window_shift + window_size
@@ -114,7 +143,35 @@ def extract_window(waveform, blackman_coeff, dither, window_size, window_shift,
             waveform,
             waveform[:-(offset + num_samples_ - num_samples + 1):-1]
         ])
-    frames = sliding_window(waveform, window_size=window_size, window_shift=window_shift)
+    return sliding_window(waveform, window_size=window_size, window_shift=window_shift)
+
+
+def extract_window(waveform, blackman_coeff, dither, window_size, window_shift,
+                   preemphasis_coefficient, raw_energy, remove_dc_offset,
+                   snip_edges, window_type, dtype, window_function=None):
+    frames = _frame_waveform(waveform, window_size, window_shift, snip_edges)
+    frames = frames.astype(dtype)
+    if window_function is None:
+        window_function = feature_window_function(
+            window_type=window_type,
+            window_size=window_size,
+            blackman_coeff=blackman_coeff
+        ).astype(dtype)
+    return process_windows(
+        frames=frames,
+        dither=dither,
+        remove_dc_offset=remove_dc_offset,
+        preemphasis_coefficient=preemphasis_coefficient,
+        window_function=window_function,
+        raw_energy=raw_energy
+    )
+
+
+def extract_window_loop(waveform, blackman_coeff, dither, window_size, window_shift,
+                        preemphasis_coefficient, raw_energy, remove_dc_offset,
+                        snip_edges, window_type, dtype):
+    """ Frame-by-frame reference implementation of extract_window, kept for tests and benchmarks. """
+    frames = _frame_waveform(waveform, window_size, window_shift, snip_edges)
     frames = frames.astype(dtype)
     log_enery = np.empty(frames.shape[0], dtype=dtype)
     for i in range(frames.shape[0]):
@@ -231,18 +288,19 @@ def compute_mel_banks(num_bins, sample_frequency, low_freq, high_freq, n):
     mel_high_freq = mel_scale(high_freq)
     mel_freq_delta = (mel_high_freq - mel_low_freq) / (num_bins + 1)
 
+    left_mel = mel_low_freq + mel_freq_delta * np.arange(num_bins)[:, np.newaxis]
+    center_mel = left_mel + mel_freq_delta
+    right_mel = center_mel + mel_freq_delta
+    # the last (Nyquist) fft bin is left at zero, as in Kaldi
+    mel = mel_scale(fft_bin_width * np.arange(num_fft_bins))
+    up_slope = (mel - left_mel) / (center_mel - left_mel)
+    down_slope = (right_mel - mel) / (right_mel - center_mel)
     mel_banks = np.zeros([num_bins, num_fft_bins + 1])
-    for i in range(num_bins):
-        left_mel = mel_low_freq + mel_freq_delta * i
-        center_mel = left_mel + mel_freq_delta
-        right_mel = center_mel + mel_freq_delta
-        for j in range(num_fft_bins):
-            mel = mel_scale(fft_bin_width * j)
-            if left_mel < mel < right_mel:
-                if mel <= center_mel:
-                    mel_banks[i, j] = (mel - left_mel) / (center_mel - left_mel)
-                else:
-                    mel_banks[i, j] = (right_mel - mel) / (right_mel - center_mel)
+    mel_banks[:, :num_fft_bins] = np.where(
+        (left_mel < mel) & (mel < right_mel),
+        np.where(mel <= center_mel, up_slope, down_slope),
+        0.0
+    )
     return mel_banks
 
 
@@ -264,6 +322,62 @@ def compute_lifter_coeffs(q, M):
 # ---------- mel-computations ----------
 
 
+# ---------- fbank-plan ----------
+
+class FbankPlan():
+    """ Everything in an fbank computation that depends only on the options.
+
+    Holds the frame sizes, FFT size, window function and transposed mel matrix,
+    so that per-utterance work is framing, FFT and one matmul. Use
+    ``FbankPlan.get`` to share one plan between all callers with equal options.
+    """
+
+    def __init__(self, sample_frequency=16000, num_mel_bins=23, frame_length=25, frame_shift=10,
+                 window_type='povey', low_freq=20, high_freq=0, blackman_coeff=0.42,
+                 round_to_power_of_two=True, dtype=np.float32):
+        self.sample_frequency = sample_frequency
+        self.num_mel_bins = num_mel_bins
+        self.window_type = window_type
+        self.blackman_coeff = blackman_coeff
+        self.dtype = np.dtype(dtype)
+        self.window_size = int(frame_length * sample_frequency * 0.001)
+        self.window_shift = int(frame_shift * sample_frequency * 0.001)
+        if round_to_power_of_two:
+            n = 1
+            while n < self.window_size:
+                n *= 2
+        else:
+            n = self.window_size
+        self.n = n
+        self.window_function = feature_window_function(
+            window_type=window_type,
+            window_size=self.window_size,
+            blackman_coeff=blackman_coeff
+        ).astype(self.dtype)
+        mel_banks = compute_mel_banks(
+            num_bins=num_mel_bins,
+            sample_frequency=sample_frequency,
+            low_freq=low_freq,
+            high_freq=high_freq,
+            n=n
+        ).astype(self.dtype)
+        self.mel_banks_t = np.ascontiguousarray(mel_banks.T)
+        for array in (self.window_function, self.mel_banks_t):
+            array.flags.writeable = False
+
+    @classmethod
+    @functools.lru_cache(maxsize=32)
+    def get(cls, sample_frequency=16000, num_mel_bins=23, frame_length=25, frame_shift=10,
+            window_type='povey', low_freq=20, high_freq=0, blackman_coeff=0.42,
+            round_to_power_of_two=True, dtype=np.float32):
+        return cls(sample_frequency=sample_frequency, num_mel_bins=num_mel_bins,
+                   frame_length=frame_length, frame_shift=frame_shift, window_type=window_type,
+                   low_freq=low_freq, high_freq=high_freq, blackman_coeff=blackman_coeff,
+                   round_to_power_of_two=round_to_power_of_two, dtype=dtype)
+
+# ---------- fbank-plan ----------
+
+
 # ---------- compute-fbank-feats ----------
 
 def compute_fbank_feats(
@@ -286,7 +400,8 @@ def compute_fbank_feats(
         use_log_fbank=True,
         use_power=True,
         window_type='povey',
-        dtype=np.float32):
+        dtype=np.float32,
+        plan=None):
     """ Compute (log) Mel filter bank energies
 
     :param waveform: Input waveform.
@@ -309,46 +424,47 @@ def compute_fbank_feats(
     :param use_power: If true, use power, else use magnitude. (bool, default = true)
     :param window_type: Type of window ("hamming"|"hanning"|"povey"|"rectangular"|"sine"|"blackmann") (string, default = "povey")
     :param dtype: Type of array (np.float32|np.float64) (dtype or string, default=np.float32)
+    :param plan: Precomputed FbankPlan; overrides the framing, mel and window options above. (FbankPlan, default = cached plan for the options above)
     :return: (Log) Mel filter bank energies.
     """
-    window_size = int(frame_length * sample_frequency * 0.001)
-    window_shift = int(frame_shift * sample_frequency * 0.001)
+    if plan is None:
+        plan = FbankPlan.get(
+            sample_frequency=sample_frequency,
+            num_mel_bins=num_mel_bins,
+            frame_length=frame_length,
+            frame_shift=frame_shift,
+            window_type=window_type,
+            low_freq=low_freq,
+            high_freq=high_freq,
+            blackman_coeff=blackman_coeff,
+            round_to_power_of_two=round_to_power_of_two,
+            dtype=dtype
+        )
+    dtype = plan.dtype
     frames, log_energy = extract_window(
         waveform=waveform,
-        blackman_coeff=blackman_coeff,
+        blackman_coeff=plan.blackman_coeff,
         dither=dither,
-        window_size=window_size,
-        window_shift=window_shift,
+        window_size=plan.window_size,
+        window_shift=plan.window_shift,
         preemphasis_coefficient=preemphasis_coefficient,
         raw_energy=raw_energy,
         remove_dc_offset=remove_dc_offset,
         snip_edges=snip_edges,
-        window_type=window_type,
-        dtype=dtype
+        window_type=plan.window_type,
+        dtype=dtype,
+        window_function=plan.window_function
     )
-    if round_to_power_of_two:
-        n = 1
-        while n < window_size:
-            n *= 2
-    else:
-        n = window_size
     if use_power:
-        spectrum = compute_power_spectrum(frames, n)
+        spectrum = compute_power_spectrum(frames, plan.n)
     else:
-        spectrum = compute_spectrum(frames, n)
-    mel_banks = compute_mel_banks(
-        num_bins=num_mel_bins,
-        sample_frequency=sample_frequency,
-        low_freq=low_freq,
-        high_freq=high_freq,
-        n=n
-    ).astype(dtype)
-    feat = np.dot(spectrum, mel_banks.T)
+        spectrum = compute_spectrum(frames, plan.n)
+    feat = np.dot(spectrum, plan.mel_banks_t)
     if use_log_fbank:
         feat = np.log(feat.clip(min=np.finfo(dtype).eps))
     if use_energy:
         if energy_floor > 0.0:
-            log_energy.clip(min=np.math.log(energy_floor))
+            log_energy.clip(min=math.log(energy_floor))
         return feat, log_energy
     return feat
 
@@ -377,7 +493,8 @@ def compute_mfcc_feats(
         snip_edges=True,
         use_energy=True,
         window_type='povey',
-        dtype=np.float32):
+        dtype=np.float32,
+        plan=None):
     """ Compute mel-frequency cepstral coefficients
 
     :param waveform: Input waveform.
@@ -400,6 +517,7 @@ def compute_mfcc_feats(
     :param use_energy: Use energy (not C0) in MFCC computation (bool, default = true)
     :param window_type: Type of window ("hamming"|"hanning"|"povey"|"rectangular"|"sine"|"blackmann") (string, default = "povey")
     :param dtype: Type of array (np.float32|np.float64) (dtype or string, default=np.float32)
+    :param plan: Precomputed FbankPlan, see compute_fbank_feats. (FbankPlan, default = cached plan for the options above)
     :return: Mel-frequency cespstral coefficients.
     """
     feat, log_energy = compute_fbank_feats(
@@ -422,10 +540,11 @@ def compute_mfcc_feats(
         use_log_fbank=True,
         use_power=True,
         window_type=window_type,
-        dtype=dtype
+        dtype=dtype,
+        plan=plan
     )
     feat = dct(feat, type=2, axis=1, norm='ortho')[:, :num_ceps]
-    lifter_coeffs = compute_lifter_coeffs(cepstral_lifter, num_ceps).astype(dtype)
+    lifter_coeffs = compute_lifter_coeffs(cepstral_lifter, num_ceps).astype(feat.dtype)
     feat = feat * lifter_coeffs
     if use_energy:
         feat[:, 0] = log_energy
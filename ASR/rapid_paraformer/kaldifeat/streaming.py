@@ -0,0 +1,139 @@
+import numpy as np
+
+from .feature import FbankPlan, compute_fbank_feats
+
+
+# ---------- streaming-fbank ----------
+
+class StreamingFbank():
+    """ Incremental compute_fbank_feats with snip_edges=True.
+
+    Feed PCM chunks of any size to ``accept_waveform``; it returns the fbank
+    frames completed by that chunk. Dither, DC removal and pre-emphasis are
+    applied per frame (as in Kaldi), so the only state carried between calls
+    is the tail of samples that do not yet fill a frame, and the frames equal
+    the offline ones exactly (with dither=0.0).
+    """
+
+    def __init__(self, plan=None, dither=0.0, preemphasis_coefficient=0.97, raw_energy=True,
+                 remove_dc_offset=True, use_energy=False, use_log_fbank=True, use_power=True, **plan_kwargs):
+        """
+        :param plan: FbankPlan to use, default FbankPlan.get(**plan_kwargs)
+        :param use_energy: If true, accept_waveform returns (feat, log_energy)
+        Other parameters as in compute_fbank_feats.
+        """
+        self.plan = plan or FbankPlan.get(**plan_kwargs)
+        self.options = dict(
+            dither=dither,
+            preemphasis_coefficient=preemphasis_coefficient,
+            raw_energy=raw_energy,
+            remove_dc_offset=remove_dc_offset,
+            use_energy=use_energy,
+            use_log_fbank=use_log_fbank,
+            use_power=use_power,
+            energy_floor=0.0
+        )
+        self.use_energy = use_energy
+        self.reset()
+
+    def reset(self):
+        self.tail = np.zeros(0, dtype=self.plan.dtype)
+        self.num_frames = 0
+
+    def accept_waveform(self, waveform):
+        """
+        :param waveform: Next samples, in the scale compute_fbank_feats expects.
+        :return: Newly completed frames of shape (k, num_mel_bins), k may be 0.
+        """
+        samples = np.concatenate([self.tail, np.asarray(waveform, dtype=self.plan.dtype)])
+        num_ready = 0
+        if len(samples) >= self.plan.window_size:
+            num_ready = 1 + (len(samples) - self.plan.window_size) // self.plan.window_shift
+        if num_ready == 0:
+            self.tail = samples
+            return self._empty()
+        used = (num_ready - 1) * self.plan.window_shift + self.plan.window_size
+        result = compute_fbank_feats(samples[:used], snip_edges=True, plan=self.plan, **self.options)
+        self.tail = samples[num_ready * self.plan.window_shift:]
+        self.num_frames += num_ready
+        return result
+
+    def _empty(self):
+        feat = np.zeros((0, self.plan.num_mel_bins), dtype=self.plan.dtype)
+        if self.use_energy:
+            return feat, np.zeros(0, dtype=self.plan.dtype)
+        return feat
+
+# ---------- streaming-fbank ----------
+
+
+# ---------- streaming-lfr ----------
+
+class StreamingLfr():
+    """ Incremental low frame rate stacking, as WavFrontend.apply_lfr.
+
+    Frame i stacks input frames i * lfr_n - (lfr_m - 1) // 2 onwards, lfr_m of
+    them, with the first frame repeated on the left. ``accept`` returns the
+    frames whose inputs have all arrived; ``finalize`` returns the rest,
+    padded on the right with the last input frame.
+    """
+
+    def __init__(self, lfr_m, lfr_n):
+        self.lfr_m = lfr_m
+        self.lfr_n = lfr_n
+        self.reset()
+
+    def reset(self):
+        self.buffer = None
+        # padded index of buffer[0]
+        self.offset = 0
+        self.num_inputs = 0
+        self.num_outputs = 0
+
+    def accept(self, feats):
+        """
+        :param feats: Next input frames of shape (k, dim).
+        :return: Newly completed LFR frames of shape (j, lfr_m * dim).
+        """
+        if self.buffer is None and len(feats) == 0:
+            return np.zeros((0, self.lfr_m * feats.shape[1]), dtype=np.float32)
+        if self.buffer is None:
+            left = np.repeat(feats[:1], (self.lfr_m - 1) // 2, axis=0)
+            self.buffer = np.concatenate([left, feats]).astype(np.float32)
+        else:
+            self.buffer = np.concatenate([self.buffer, feats])
+        self.num_inputs += len(feats)
+        padded_len = self.offset + len(self.buffer)
+        num_ready = max(0, (padded_len - self.lfr_m) // self.lfr_n + 1)
+        return self._emit(num_ready)
+
+    def finalize(self):
+        """Remaining LFR frames once the input has ended."""
+        if self.buffer is None:
+            return self._emit(0)
+        num_total = int(np.ceil(self.num_inputs / self.lfr_n))
+        needed = (num_total - 1) * self.lfr_n + self.lfr_m - self.offset
+        if needed > len(self.buffer):
+            right = np.repeat(self.buffer[-1:], needed - len(self.buffer), axis=0)
+            self.buffer = np.concatenate([self.buffer, right])
+        return self._emit(num_total)
+
+    def _emit(self, num_ready):
+        dim = 0 if self.buffer is None else self.buffer.shape[1]
+        count = num_ready - self.num_outputs
+        if count <= 0:
+            return np.zeros((0, self.lfr_m * dim), dtype=np.float32)
+        start = self.num_outputs * self.lfr_n - self.offset
+        rows = np.ascontiguousarray(self.buffer[start:])
+        row_stride, col_stride = rows.strides
+        frames = np.lib.stride_tricks.as_strided(
+            rows, shape=(count, self.lfr_m * dim), strides=(self.lfr_n * row_stride, col_stride))
+        frames = frames.copy()
+        self.num_outputs = num_ready
+        # drop the rows no later frame reads
+        drop = min(self.num_outputs * self.lfr_n - self.offset, len(self.buffer))
+        self.buffer = self.buffer[drop:]
+        self.offset += drop
+        return frames
+
+# ---------- streaming-lfr ----------
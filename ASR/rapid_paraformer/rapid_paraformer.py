@@ -1,22 +1,24 @@
 # -*- encoding: utf-8 -*-
 # @Author: SWHL
 # @Contact: liekkaskono@163.com
+import threading
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Union, Tuple
+from typing import Callable, List, Union, Tuple
 
-import librosa
 import numpy as np
 
-from .utils import (CharTokenizer, Hypothesis, ONNXRuntimeError,
+from .utils import (ASRResult, CharTokenizer, ONNXRuntimeError,
                     OrtInferSession, TokenIDConverter, WavFrontend, get_logger,
-                    read_yaml)
+                    read_wav, read_yaml, resample, to_waveform)
 
 logging = get_logger()
 
 
 class RapidParaformer():
-    def __init__(self, config_path: Union[str, Path]) -> None:
+    def __init__(self, config_path: Union[str, Path],
+                 session_factory: Callable = None) -> None:
         if not Path(config_path).exists():
             raise FileNotFoundError(f'{config_path} does not exist.')
 
@@ -28,105 +30,246 @@ class RapidParaformer():
             cmvn_file=config['WavFrontend']['cmvn_file'],
             **config['WavFrontend']['frontend_conf']
         )
-        self.ort_infer = OrtInferSession(config['Model'])
+        self.ort_infer = OrtInferSession(config['Model'], session_factory)
         self.batch_size = config['Model']['batch_size']
+        # long-form mode: audio over max_segment_seconds is split at silences
+        max_segment_seconds = config['Model'].get('max_segment_seconds', 20)
+        self.max_segment_frames = int(max_segment_seconds * 1000 / self.frontend.frame_shift)
+        self.segment_workers = config['Model'].get('segment_workers', 1)
+        # fbank/LFR of the utterances in a batch run in parallel, numpy releases the GIL
+        feature_workers = config['Model'].get('feature_workers', 1)
+        self.feature_pool = None
+        if feature_workers > 1:
+            self.feature_pool = ThreadPoolExecutor(
+                feature_workers, thread_name_prefix='asr-feature')
+        self.token_table = self.build_token_table(self.converter, self.tokenizer)
 
-    def __call__(self, wav_content: Union[str, np.ndarray, List[str]]) -> List:
-        waveform_list = self.load_data(wav_content)
+        # fbank frames seen and removed by VAD, to measure the compute it saves
+        self.vad_lock = threading.Lock()
+        self.vad_frames_total = 0
+        self.vad_frames_removed = 0
+
+    def __call__(self, wav_content: Union[str, np.ndarray, bytes, List[Union[str, np.ndarray, bytes]]],
+                 fs: int = 16000, sort_by_length: bool = False, detailed: bool = False) -> List:
+        """
+        Texts in input order, or ASRResults with detailed=True
+        """
+        waveform_list = self.load_data(wav_content, fs)
         waveform_nums = len(waveform_list)
 
-        asr_res = []
-        for beg_idx in range(0, waveform_nums, self.batch_size):
-            end_idx = min(waveform_nums, beg_idx + self.batch_size)
+        # feature length grows with the number of samples, so batching the
+        # sorted order keeps utterances of similar length together and
+        # spends little of each batch on padding
+        if sort_by_length:
+            order = sorted(range(waveform_nums),
+                           key=lambda i: waveform_list[i].shape[1])
+        else:
+            order = list(range(waveform_nums))
+
+        asr_res = [None] * waveform_nums
+        for i, waveform in enumerate(waveform_list):
+            if self.is_too_short(waveform):
+                # not even one fbank window, nothing for the model to hear
+                asr_res[i] = ASRResult('', duration=waveform.shape[1] / self.frontend.fs)
+        order = [i for i in order if asr_res[i] is None]
+
+        for beg_idx in range(0, len(order), self.batch_size):
+            batch_idx = order[beg_idx:beg_idx + self.batch_size]
+            results = self.recognize_batch([waveform_list[i] for i in batch_idx])
+            for i, result in zip(batch_idx, results):
+                asr_res[i] = result
+
+        if not detailed:
+            asr_res = [result.text for result in asr_res]
+        return asr_res
+
+    def recognize_batch(self, waveform_list: List[np.ndarray]) -> List[ASRResult]:
+        feats, feats_len, frame_stats = self.extract_feat(waveform_list)
+        if self.frontend.vad:
+            self.count_vad(frame_stats)
+
+        try:
+            am_scores, token_nums = self.infer(feats, feats_len)
+        except ONNXRuntimeError:
+            if len(waveform_list) > 1:
+                # one silent or noisy utterance fails the whole batch,
+                # retry one by one so the others still get their text
+                return [result for waveform in waveform_list
+                        for result in self.recognize_batch([waveform])]
+            logging.warning("input wav is silence or noise")
+            texts, scores, token_nums = [''], np.array([-np.inf]), np.array([1])
+        else:
+            texts, scores = self.decode(am_scores, token_nums)
+
+        return [ASRResult(text=text,
+                          score=float(score) / max(1, int(token_num)),
+                          duration=waveform.shape[1] / self.frontend.fs,
+                          voiced_ratio=float(voiced) / max(1, total))
+                for waveform, text, score, token_num, (_, total, voiced)
+                in zip(waveform_list, texts, scores, token_nums, frame_stats)]
+
+    def is_too_short(self, waveform: np.ndarray) -> bool:
+        """waveform: (1, N) as returned by load_data"""
+        return waveform.shape[1] < self.frontend.fbank_plan.window_size
+
+    def is_long(self, waveform: np.ndarray) -> bool:
+        """waveform: (1, N) as returned by load_data"""
+        max_samples = self.max_segment_frames * self.frontend.frame_shift * self.frontend.fs // 1000
+        return waveform.shape[1] > max_samples
+
+    def transcribe_long(self, wav_content: Union[str, np.ndarray, bytes],
+                        fs: int = 16000, workers: int = None) -> ASRResult:
+        """
+        Long-form mode: split one recording at VAD silences into segments of
+        at most max_segment_frames, run them as length-sorted padded batches,
+        on up to `workers` threads, and join the text in order
+        """
+        waveform = self.load_data(wav_content, fs)[0]
+        speech, log_energy = self.frontend.fbank_energy(waveform)
+        segments = self.frontend.split_segments(log_energy, self.max_segment_frames)
+        feats = [self.frontend.lfr_cmvn(speech[b:e])[0] for b, e in segments]
 
-            feats, feats_len = self.extract_feat(waveform_list[beg_idx:end_idx])
+        order = sorted(range(len(feats)), key=lambda i: feats[i].shape[0])
+        batches = [order[i:i + self.batch_size]
+                   for i in range(0, len(order), self.batch_size)]
 
+        def run(batch: List[int]) -> List[Tuple[str, float, int]]:
+            batch_feats = [feats[i] for i in batch]
+            feats_len = np.array([feat.shape[0] for feat in batch_feats],
+                                 dtype=np.int32)
             try:
-                am_scores, valid_token_lens = self.infer(feats, feats_len)
+                am_scores, token_nums = self.infer(
+                    self.pad_feats(batch_feats, feats_len.max()), feats_len)
             except ONNXRuntimeError:
-                logging.warning("input wav is silence or noise")
-                preds = []
-            else:
-                preds = self.decode(am_scores, valid_token_lens)
+                logging.warning("segment is silence or noise")
+                return [('', 0.0, 0)] * len(batch)
+            texts, scores = self.decode(am_scores, token_nums)
+            return list(zip(texts, scores.tolist(), token_nums.tolist()))
 
-            asr_res.extend(preds)
-        return asr_res
+        workers = min(workers or self.segment_workers, len(batches))
+        if workers > 1:
+            with ThreadPoolExecutor(workers) as pool:
+                results = list(pool.map(run, batches))
+        else:
+            results = [run(batch) for batch in batches]
+
+        preds = [('', 0.0, 0)] * len(feats)
+        for batch, batch_preds in zip(batches, results):
+            for i, pred in zip(batch, batch_preds):
+                preds[i] = pred
+        logging.info(f'Long-form: {speech.shape[0]} frames in '
+                     f'{len(segments)} segments')
+        token_num = sum(n for _, _, n in preds)
+        score = sum(s for _, s, _ in preds) / token_num if token_num else -np.inf
+        voiced = self.frontend.vad_mask(log_energy)
+        return ASRResult(text=''.join(text for text, _, _ in preds),
+                         score=float(score),
+                         duration=waveform.shape[1] / self.frontend.fs,
+                         voiced_ratio=float(voiced.mean()) if voiced.size else 0.0)
+
+    def transcribe_feat(self, feat: np.ndarray) -> str:
+        """Transcribe LFR+CMVN features, e.g. collected from frontend.stream()"""
+        try:
+            am_scores, token_nums = self.infer(
+                feat[None, ...], np.array([feat.shape[0]], dtype=np.int32))
+        except ONNXRuntimeError:
+            logging.warning("input wav is silence or noise")
+            return ''
+        return self.decode(am_scores, token_nums)[0][0]
 
     def load_data(self,
-                  wav_content: Union[str, np.ndarray, List[str]]) -> List:
+                  wav_content: Union[str, np.ndarray, bytes, List[Union[str, np.ndarray, bytes]]],
+                  fs: int = 16000) -> List:
+        """
+        Wav paths, or PCM at sample rate fs: int16/float ndarrays of shape
+        (N,) or (channels, N), or little-endian int16 mono bytes
+        """
+        target_fs = self.frontend.fs
+
         def load_wav(path: str) -> np.ndarray:
-            waveform, sr = librosa.load(path, sr=None)
-            waveform = librosa.resample(waveform, orig_sr=sr, target_sr=16000)
-            return waveform[None, ...]
+            waveform, sr = read_wav(path)
+            return resample(waveform, sr, target_fs)[None, ...]
+
+        if isinstance(wav_content, (bytes, bytearray, memoryview)):
+            wav_content = np.frombuffer(wav_content, dtype='<i2')
 
         if isinstance(wav_content, np.ndarray):
-            return [wav_content]
+            waveform = resample(to_waveform(wav_content), fs, target_fs)
+            return [waveform[None, ...]]
 
         if isinstance(wav_content, str):
             return [load_wav(wav_content)]
 
         if isinstance(wav_content, list):
-            return [load_wav(path) for path in wav_content]
+            return [self.load_data(item, fs)[0] for item in wav_content]
 
         raise TypeError(
-            f'The type of {wav_content} is not in [str, np.ndarray, list]')
+            f'The type of {wav_content} is not in [str, np.ndarray, bytes, list]')
 
     def extract_feat(self,
                      waveform_list: List[np.ndarray]
-                     ) -> Tuple[np.ndarray, np.ndarray]:
-        feats, feats_len = [], []
-        for waveform in waveform_list:
-            speech, _ = self.frontend.fbank(waveform)
-            feat, feat_len = self.frontend.lfr_cmvn(speech)
-            feats.append(feat)
-            feats_len.append(feat_len)
+                     ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        if self.feature_pool is not None and len(waveform_list) > 1:
+            results = list(self.feature_pool.map(self.frontend.features,
+                                                 waveform_list))
+        else:
+            results = [self.frontend.features(waveform)
+                       for waveform in waveform_list]
+        feats = [feat for feat, _, _ in results]
+        feats_len = [feat_len for _, feat_len, _ in results]
+        frame_stats = [stats for _, _, stats in results]
 
         feats = self.pad_feats(feats, np.max(feats_len))
         feats_len = np.array(feats_len).astype(np.int32)
-        return feats, feats_len
+        return feats, feats_len, np.array(frame_stats).reshape(-1, 3)
+
+    def count_vad(self, frame_stats: np.ndarray) -> None:
+        """frame_stats: (removed, total, voiced) fbank frames per utterance"""
+        removed, total, _ = frame_stats.sum(axis=0)
+        with self.vad_lock:
+            self.vad_frames_removed += int(removed)
+            self.vad_frames_total += int(total)
+            saved = self.vad_frames_removed / max(1, self.vad_frames_total)
+        logging.info(f'VAD removed {removed} of {total} frames, '
+                     f'{saved:.1%} of all frames so far')
 
     @staticmethod
     def pad_feats(feats: List[np.ndarray], max_feat_len: int) -> np.ndarray:
-        def pad_feat(feat: np.ndarray, cur_len: int) -> np.ndarray:
-            pad_width = ((0, max_feat_len - cur_len), (0, 0))
-            return np.pad(feat, pad_width, 'constant', constant_values=0)
-
-        feat_res = [pad_feat(feat, feat.shape[0]) for feat in feats]
-        feats = np.array(feat_res).astype(np.float32)
-        return feats
+        batch = np.zeros((len(feats), max_feat_len, feats[0].shape[1]),
+                         dtype=np.float32)
+        for i, feat in enumerate(feats):
+            batch[i, :feat.shape[0]] = feat
+        return batch
 
     def infer(self, feats: np.ndarray,
               feats_len: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
         am_scores, token_nums = self.ort_infer([feats, feats_len])
         return am_scores, token_nums
 
-    def decode(self, am_scores: np.ndarray, token_nums: int) -> List[str]:
-        return [self.decode_one(am_score, token_num)
-                for am_score, token_num in zip(am_scores, token_nums)]
-
-    def decode_one(self,
-                   am_score: np.ndarray,
-                   valid_token_num: int) -> List[str]:
-        yseq = am_score.argmax(axis=-1)
-        score = am_score.max(axis=-1)
-        score = np.sum(score, axis=-1)
-
-        # pad with mask tokens to ensure compatibility with sos/eos tokens
-        # asr_model.sos:1  asr_model.eos:2
-        yseq = np.array([1] + yseq.tolist() + [2])
-        hyp = Hypothesis(yseq=yseq, score=score)
-
-        # remove sos/eos and get results
-        last_pos = -1
-        token_int = hyp.yseq[1:last_pos].tolist()
-
-        # remove blank symbol id, which is assumed to be 0
-        token_int = list(filter(lambda x: x not in (0, 2), token_int))
-
-        # Change integer-ids to tokens
-        token = self.converter.ids2tokens(token_int)
-        text = self.tokenizer.tokens2text(token)
-        return text[:valid_token_num-1]
+    @staticmethod
+    def build_token_table(converter: TokenIDConverter,
+                          tokenizer: CharTokenizer) -> np.ndarray:
+        """Token id -> text, with blank (0) and eos (2) mapped to ''."""
+        tokens = tokenizer.tokens2text_list(converter.token_list)
+        token_table = np.array(tokens, dtype=object)
+        token_table[[0, 2]] = ''
+        return token_table
+
+    def decode(self, am_scores: np.ndarray,
+               token_nums: np.ndarray) -> Tuple[List[str], np.ndarray]:
+        """Greedy decode of a whole batch.
+
+        :return: Texts, and per utterance the summed max log-probability over
+            its valid token positions.
+        """
+        yseq = am_scores.argmax(axis=-1)
+        max_scores = am_scores.max(axis=-1)
+        valid = np.arange(am_scores.shape[1]) < np.asarray(token_nums)[:, None]
+        scores = np.where(valid, max_scores, 0).sum(axis=-1)
+
+        texts = [''.join(tokens)[:token_num - 1]
+                 for tokens, token_num in zip(self.token_table[yseq], token_nums)]
+        return texts, scores
 
 
 if __name__ == '__main__':
@@ -1,19 +1,33 @@
 # -*- encoding: utf-8 -*-
 # @Author: SWHL
 # @Contact: liekkaskono@163.com
+import contextlib
 import functools
 import logging
+import os
 import pickle
+import queue
+import warnings
 from pathlib import Path
-from typing import Any, Dict, Iterable, List, NamedTuple, Set, Tuple, Union
+from typing import (Any, Callable, Dict, Iterable, List, NamedTuple, Set,
+                    Tuple, Union)
 
 import numpy as np
+import soundfile
 import yaml
-from onnxruntime import (GraphOptimizationLevel, InferenceSession,
-                         SessionOptions, get_available_providers, get_device)
+from onnxruntime import (ExecutionMode, GraphOptimizationLevel,
+                         InferenceSession, SessionOptions,
+                         get_available_providers, get_device)
+from scipy.signal import resample_poly
 from typeguard import check_argument_types
 
-from .kaldifeat import compute_fbank_feats
+from .kaldifeat import (FbankPlan, StreamingFbank, StreamingLfr,
+                        compute_fbank_feats, compute_vad)
+
+try:
+    import soxr
+except ImportError:
+    soxr = None
 
 root_dir = Path(__file__).resolve().parent
 
@@ -106,9 +120,11 @@ class CharTokenizer():
                 line = line[1:]
         return tokens
 
+    def tokens2text_list(self, tokens: Iterable[str]) -> List[str]:
+        return [t if t != self.space_symbol else " " for t in tokens]
+
     def tokens2text(self, tokens: Iterable[str]) -> str:
-        tokens = [t if t != self.space_symbol else " " for t in tokens]
-        return "".join(tokens)
+        return "".join(self.tokens2text_list(tokens))
 
     def __repr__(self):
         return (
@@ -135,7 +151,11 @@ class WavFrontend():
             filter_length_max: float = -1,
             lfr_m: int = 1,
             lfr_n: int = 1,
-            dither: float = 1.0
+            dither: float = 1.0,
+            vad: bool = False,
+            vad_padding: int = 20,
+            vad_energy_threshold: float = 5.0,
+            vad_energy_mean_scale: float = 0.5
     ) -> None:
         check_argument_types()
 
@@ -150,9 +170,26 @@ class WavFrontend():
         self.lfr_n = lfr_n
         self.cmvn_file = cmvn_file
         self.dither = dither
+        self.vad = vad
+        self.vad_padding = vad_padding
+        self.vad_energy_threshold = vad_energy_threshold
+        self.vad_energy_mean_scale = vad_energy_mean_scale
 
         if self.cmvn_file:
             self.cmvn = self.load_cmvn()
+            # float32 rows broadcast over frames, so CMVN never materializes a (T, dim) table
+            self.cmvn_means = self.cmvn[0:1].astype(np.float32)
+            self.cmvn_vars = self.cmvn[1:2].astype(np.float32)
+
+        self.fbank_plan = FbankPlan.get(sample_frequency=self.fs,
+                                        num_mel_bins=self.n_mels,
+                                        frame_length=self.frame_length,
+                                        frame_shift=self.frame_shift,
+                                        window_type=self.window)
+
+    def stream(self) -> 'WavFrontendStream':
+        """Incremental fbank + LFR + CMVN, for audio that is still arriving"""
+        return WavFrontendStream(self)
 
     def fbank(self,
               input_content: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
@@ -160,60 +197,140 @@ class WavFrontend():
         waveform = input_content[0][:waveform_len]
         waveform = waveform * (1 << 15)
         mat = compute_fbank_feats(waveform,
-                                  num_mel_bins=self.n_mels,
-                                  frame_length=self.frame_length,
-                                  frame_shift=self.frame_shift,
                                   dither=self.dither,
                                   energy_floor=0.0,
-                                  window_type=self.window,
-                                  sample_frequency=self.fs)
+                                  plan=self.fbank_plan)
         feat = mat.astype(np.float32)
         feat_len = np.array(mat.shape[0]).astype(np.int32)
         return feat, feat_len
 
+    def fbank_vad(self,
+                  input_content: np.ndarray) -> Tuple[np.ndarray, np.ndarray, int, int]:
+        """
+        fbank with leading and trailing silence trimmed when vad is enabled,
+        also returns the number of frames removed and of voiced frames
+        """
+        mat, log_energy = self.fbank_energy(input_content)
+        voiced = self.vad_mask(log_energy) if len(log_energy) else np.zeros(0, bool)
+        start, end = 0, mat.shape[0]
+        if self.vad:
+            start, end = self.vad_bounds(log_energy, voiced)
+        feat = mat[start:end]
+        feat_len = np.array(feat.shape[0]).astype(np.int32)
+        return feat, feat_len, mat.shape[0] - feat.shape[0], int(voiced.sum())
+
+    def features(self, input_content: np.ndarray
+                 ) -> Tuple[np.ndarray, np.ndarray, Tuple[int, int, int]]:
+        """
+        Model input for one waveform: fbank (VAD trimmed if enabled), LFR and
+        CMVN; also (removed, total, voiced) fbank frames
+        """
+        speech, _, removed, voiced = self.fbank_vad(input_content)
+        feat, feat_len = self.lfr_cmvn(speech)
+        return feat, feat_len, (removed, speech.shape[0] + removed, voiced)
+
+    def fbank_energy(self,
+                     input_content: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """float32 fbank and the raw log energy of every frame"""
+        waveform = input_content[0] * (1 << 15)
+        mat, log_energy = compute_fbank_feats(waveform,
+                                              dither=self.dither,
+                                              energy_floor=0.0,
+                                              use_energy=True,
+                                              plan=self.fbank_plan)
+        return mat.astype(np.float32, copy=False), log_energy
+
+    def vad_bounds(self, log_energy: np.ndarray,
+                   voiced: np.ndarray = None) -> Tuple[int, int]:
+        """
+        First and one past the last frame to keep: the voiced span widened by
+        vad_padding frames each side, or everything if no frame is voiced
+        """
+        num_frames = log_energy.shape[0]
+        if num_frames == 0:
+            return 0, 0
+        if voiced is None:
+            voiced = self.vad_mask(log_energy)
+        voiced = np.flatnonzero(voiced)
+        if voiced.size == 0:
+            return 0, num_frames
+        start = max(0, voiced[0] - self.vad_padding)
+        end = min(num_frames, voiced[-1] + 1 + self.vad_padding)
+        return int(start), int(end)
+
+    def vad_mask(self, log_energy: np.ndarray) -> np.ndarray:
+        return compute_vad(log_energy,
+                           energy_mean_scale=self.vad_energy_mean_scale,
+                           energy_threshold=self.vad_energy_threshold)
+
+    def split_segments(self, log_energy: np.ndarray,
+                       max_frames: int) -> List[Tuple[int, int]]:
+        """
+        Split frames into [begin, end) segments of at most max_frames, cutting
+        at the quietest unvoiced frame in the second half of each window (the
+        quietest frame overall if it is all speech); segments without a voiced
+        frame are dropped
+        """
+        num_frames = log_energy.shape[0]
+        voiced = self.vad_mask(log_energy)
+        segments = []
+        start = 0
+        while num_frames - start > max_frames:
+            lo, hi = start + max_frames // 2, start + max_frames
+            energy = log_energy[lo:hi]
+            if not voiced[lo:hi].all():
+                energy = np.where(voiced[lo:hi], np.inf, energy)
+            cut = lo + int(np.argmin(energy))
+            segments.append((start, cut))
+            start = cut
+        segments.append((start, num_frames))
+        if not voiced.any():
+            return segments
+        return [(b, e) for b, e in segments if voiced[b:e].any()]
+
     def lfr_cmvn(self, feat: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
         if self.lfr_m != 1 or self.lfr_n != 1:
-            feat = self.apply_lfr(feat, self.lfr_m, self.lfr_n)
+            feat = self.lfr_view(feat, self.lfr_m, self.lfr_n)
 
         if self.cmvn_file:
             feat = self.apply_cmvn(feat)
+        else:
+            feat = np.ascontiguousarray(feat, dtype=np.float32)
 
         feat_len = np.array(feat.shape[0]).astype(np.int32)
         return feat, feat_len
 
     @staticmethod
-    def apply_lfr(inputs: np.ndarray, lfr_m: int, lfr_n: int) -> np.ndarray:
-        LFR_inputs = []
-
-        T = inputs.shape[0]
+    def lfr_view(inputs: np.ndarray, lfr_m: int, lfr_n: int) -> np.ndarray:
+        """
+        Read-only (T_lfr, lfr_m * dim) view of the LFR-stacked features over an
+        edge-padded float32 copy of inputs
+        """
+        T, dim = inputs.shape
         T_lfr = int(np.ceil(T / lfr_n))
-        left_padding = np.tile(inputs[0], ((lfr_m - 1) // 2, 1))
-        inputs = np.vstack((left_padding, inputs))
-        T = T + (lfr_m - 1) // 2
-        for i in range(T_lfr):
-            if lfr_m <= T - i * lfr_n:
-                LFR_inputs.append(
-                    (inputs[i * lfr_n:i * lfr_n + lfr_m]).reshape(1, -1))
-            else:
-                # process last LFR frame
-                num_padding = lfr_m - (T - i * lfr_n)
-                frame = inputs[i * lfr_n:].reshape(-1)
-                for _ in range(num_padding):
-                    frame = np.hstack((frame, inputs[-1]))
+        left_padding = (lfr_m - 1) // 2
+        # the last LFR frames repeat the last input frame
+        right_padding = max(0, (T_lfr - 1) * lfr_n + lfr_m - (T + left_padding))
+        padded = np.pad(inputs.astype(np.float32, copy=False),
+                        ((left_padding, right_padding), (0, 0)), mode='edge')
+        row_stride, col_stride = padded.strides
+        return np.lib.stride_tricks.as_strided(
+            padded, shape=(T_lfr, lfr_m * dim),
+            strides=(lfr_n * row_stride, col_stride), writeable=False)
 
-                LFR_inputs.append(frame)
-        LFR_outputs = np.vstack(LFR_inputs).astype(np.float32)
-        return LFR_outputs
+    @staticmethod
+    def apply_lfr(inputs: np.ndarray, lfr_m: int, lfr_n: int) -> np.ndarray:
+        return np.ascontiguousarray(WavFrontend.lfr_view(inputs, lfr_m, lfr_n))
 
     def apply_cmvn(self, inputs: np.ndarray) -> np.ndarray:
         """
-        Apply CMVN with mvn data
+        Apply CMVN with mvn data, into a new contiguous float32 array
         """
         frame, dim = inputs.shape
-        means = np.tile(self.cmvn[0:1, :dim], (frame, 1))
-        vars = np.tile(self.cmvn[1:2, :dim], (frame, 1))
-        inputs = (inputs + means) * vars
-        return inputs
+        outputs = np.empty((frame, dim), dtype=np.float32)
+        np.add(inputs, self.cmvn_means[:, :dim], out=outputs, casting='same_kind')
+        outputs *= self.cmvn_vars[:, :dim]
+        return outputs
 
     def load_cmvn(self,) -> np.ndarray:
         with open(self.cmvn_file, 'r', encoding='utf-8') as f:
@@ -242,6 +359,55 @@ class WavFrontend():
         return cmvn
 
 
+class WavFrontendStream():
+    """Streaming counterpart of WavFrontend.fbank followed by lfr_cmvn.
+
+    accept_waveform takes float samples at the frontend rate and returns the
+    features completed so far; finalize returns the rest. Concatenated, they
+    equal the offline features (VAD trimming is not applied).
+    """
+
+    def __init__(self, frontend: WavFrontend) -> None:
+        self.frontend = frontend
+        self.fbank = StreamingFbank(plan=frontend.fbank_plan,
+                                    dither=frontend.dither)
+        self.lfr = None
+        if frontend.lfr_m != 1 or frontend.lfr_n != 1:
+            self.lfr = StreamingLfr(frontend.lfr_m, frontend.lfr_n)
+
+    def accept_waveform(self, waveform: np.ndarray) -> np.ndarray:
+        feat = self.fbank.accept_waveform(waveform * (1 << 15))
+        if self.lfr is not None:
+            feat = self.lfr.accept(feat)
+        return self._cmvn(feat)
+
+    def finalize(self) -> np.ndarray:
+        if self.lfr is None:
+            return self._cmvn(np.zeros((0, self.frontend.n_mels), np.float32))
+        return self._cmvn(self.lfr.finalize())
+
+    def _cmvn(self, feat: np.ndarray) -> np.ndarray:
+        if self.frontend.cmvn_file:
+            return self.frontend.apply_cmvn(feat)
+        return np.ascontiguousarray(feat, dtype=np.float32)
+
+
+class ASRResult(NamedTuple):
+    """Recognition result of one utterance."""
+
+    text: str
+    # mean log-probability of the greedy tokens, -inf if the model rejected the input
+    score: float = float('-inf')
+    # seconds of audio
+    duration: float = 0.0
+    # fraction of fbank frames the energy VAD marks voiced
+    voiced_ratio: float = 0.0
+
+    @property
+    def confidence(self) -> float:
+        return float(np.exp(self.score))
+
+
 class Hypothesis(NamedTuple):
     """Hypothesis data type."""
 
@@ -268,11 +434,34 @@ class ONNXRuntimeError(Exception):
 
 
 class OrtInferSession():
-    def __init__(self, config):
+    """A pool of InferenceSessions over one model.
+
+    Model.session_pool in config.yaml sets the pool size and each session's
+    thread budget; intra_op_num_threads 0 splits the CPU cores evenly over the
+    sessions. Sessions are created by `session_factory(config, providers,
+    sess_options)` when given (the application uses it for its model cache
+    and precision switch), else straight from Model.model_path. Callers hold
+    a session for the duration of one run, either via __call__ or with
+    `checkout()`, so concurrent requests run on separate sessions instead of
+    oversubscribing one.
+    """
+
+    def __init__(self, config, session_factory: Callable = None):
+        pool_conf = config.get('session_pool') or {}
+        pool_size = max(1, pool_conf.get('size', 1))
+        intra_op_num_threads = pool_conf.get('intra_op_num_threads', 0) \
+            or max(1, (os.cpu_count() or 1) // pool_size)
+
         sess_opt = SessionOptions()
         sess_opt.log_severity_level = 4
-        sess_opt.enable_cpu_mem_arena = False
+        sess_opt.enable_cpu_mem_arena = pool_conf.get('enable_cpu_mem_arena', False)
         sess_opt.graph_optimization_level = GraphOptimizationLevel.ORT_ENABLE_ALL
+        sess_opt.intra_op_num_threads = intra_op_num_threads
+        sess_opt.inter_op_num_threads = pool_conf.get('inter_op_num_threads', 1)
+        if pool_conf.get('execution_mode', 'sequential') == 'parallel':
+            sess_opt.execution_mode = ExecutionMode.ORT_PARALLEL
+        else:
+            sess_opt.execution_mode = ExecutionMode.ORT_SEQUENTIAL
 
         cuda_ep = 'CUDAExecutionProvider'
         cpu_ep = 'CPUExecutionProvider'
@@ -286,11 +475,17 @@ class OrtInferSession():
             EP_list = [(cuda_ep, config[cuda_ep])]
         EP_list.append((cpu_ep, cpu_provider_options))
 
-        config['model_path'] = config['model_path']
-        self._verify_model(config['model_path'])
-        self.session = InferenceSession(config['model_path'],
-                                        sess_options=sess_opt,
-                                        providers=EP_list)
+        if session_factory is None:
+            self._verify_model(config['model_path'])
+            session_factory = self._default_session
+        self.sessions = [session_factory(config, EP_list, sess_opt)
+                         for _ in range(pool_size)]
+        self.session = self.sessions[0]
+        self.idle = queue.Queue()
+        for session in self.sessions:
+            self.idle.put(session)
+        logging.info('ONNX session pool: %i sessions, %i intra-op threads each',
+                     pool_size, intra_op_num_threads)
 
         if config['use_cuda'] and cuda_ep not in self.session.get_providers():
             warnings.warn(f'{cuda_ep} is not avaiable for current env, the inference part is automatically shifted to be executed under {cpu_ep}.\n'
@@ -299,13 +494,23 @@ class OrtInferSession():
                           'https://onnxruntime.ai/docs/execution-providers/CUDA-ExecutionProvider.html',
                           RuntimeWarning)
 
+    @contextlib.contextmanager
+    def checkout(self, timeout: float = None):
+        """Borrow an idle session, waiting up to timeout seconds for one."""
+        session = self.idle.get(timeout=timeout)
+        try:
+            yield session
+        finally:
+            self.idle.put(session)
+
     def __call__(self,
                  input_content: List[Union[np.ndarray, np.ndarray]]) -> np.ndarray:
         input_dict = dict(zip(self.get_input_names(), input_content))
-        try:
-            return self.session.run(None, input_dict)
-        except Exception as e:
-            raise ONNXRuntimeError('ONNXRuntime inferece failed.') from e
+        with self.checkout() as session:
+            try:
+                return session.run(None, input_dict)
+            except Exception as e:
+                raise ONNXRuntimeError('ONNXRuntime inferece failed.') from e
 
     def get_input_names(self, ):
         return [v.name for v in self.session.get_inputs()]
@@ -322,6 +527,11 @@ class OrtInferSession():
             return True
         return False
 
+    @staticmethod
+    def _default_session(config, providers, sess_options):
+        return InferenceSession(config['model_path'], sess_options=sess_options,
+                                providers=providers)
+
     @staticmethod
     def _verify_model(model_path):
         model_path = Path(model_path)
@@ -331,6 +541,42 @@ class OrtInferSession():
             raise FileExistsError(f'{model_path} is not a file.')
 
 
+def to_waveform(samples: np.ndarray) -> np.ndarray:
+    """int16 or float PCM of shape (N,) or (channels, N) -> float32 mono (N,)."""
+    if samples.dtype == np.int16:
+        samples = samples.astype(np.float32) / (1 << 15)
+    else:
+        samples = samples.astype(np.float32, copy=False)
+    if samples.ndim == 2:
+        samples = samples[0] if samples.shape[0] == 1 else samples.mean(axis=0)
+    return samples
+
+
+def resample_ratio(orig_sr: int, target_sr: int) -> Tuple[int, int]:
+    gcd = np.gcd(int(orig_sr), int(target_sr))
+    return int(target_sr) // gcd, int(orig_sr) // gcd
+
+
+def resample(waveform: np.ndarray, orig_sr: int,
+             target_sr: int = 16000) -> np.ndarray:
+    """Resample float32 mono audio, a no-op when the rates already match.
+
+    Uses soxr (the resampler librosa itself defaults to) when installed, else
+    a polyphase filter.
+    """
+    if orig_sr == target_sr:
+        return waveform
+    if soxr is not None:
+        return soxr.resample(waveform, orig_sr, target_sr, quality='HQ')
+    up, down = resample_ratio(orig_sr, target_sr)
+    return resample_poly(waveform, up, down).astype(np.float32)
+
+
+def read_wav(path: Union[str, Path]) -> Tuple[np.ndarray, int]:
+    waveform, sr = soundfile.read(str(path), dtype='float32', always_2d=True)
+    return to_waveform(waveform.T), sr
+
+
 def read_yaml(yaml_path: Union[str, Path]) -> Dict:
     if not Path(yaml_path).exists():
         raise FileExistsError(f'The {yaml_path} does not exist.')
@@ -8,6 +8,7 @@ import openai  # 确保安装：pip install openai
 # 假设这些模块在正确的路径下
 import GPT.machine_id
 import GPT.tune as tune
+from GPT.SentenceChunker import SentenceChunker, SentenceEvent
 
 # 配置日志记录，格式更易读
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(filename)s:%(lineno)d - %(message)s')
@@ -41,15 +42,24 @@ class GPTService:
             raise ValueError("模型未指定。")
 
         logging.info(f'已指定模型: {self.api_model}') # Log the model being used
+        self.tunes = {args.character: self.tune}  # 各角色的个性化设置，按需加载
         logging.info('通义千问 API 机器人已初始化。')
 
-    def ask(self, text):
+    def get_tune(self, character=None):
+        if character is None:
+            return self.tune
+        if character not in self.tunes:
+            self.tunes[character] = tune.get_tune(character, self.api_model)
+        return self.tunes[character]
+
+    def ask(self, text, character=None):
         stime = time.time()  # 记录开始时间
+        system_tune = self.get_tune(character)
         try:
-            logging.debug(f'正在向通义千问发送请求：{self.tune + "\n" + text}')  # 日志记录请求内容
+            logging.debug(f'正在向通义千问发送请求：{system_tune}\n{text}')  # 日志记录请求内容
             completion = openai.ChatCompletion.create(
                 model=self.api_model,  # Access api_model using self
-                messages=[{'role': 'system', 'content': self.tune},  # 系统指令
+                messages=[{'role': 'system', 'content': system_tune},  # 系统指令
                           {'role': 'user', 'content': text}],  # 用户输入
                 stream=False  # 非流式响应
             )
@@ -63,22 +73,47 @@ class GPTService:
             logging.exception(f'未知错误: {e}')  # 日志记录其他异常
             return "错误：发生未知错误。"  # 返回错误信息
 
-    def ask_stream(self, text):
+    def ask_stream(self, text, character=None, cancel_token=None):
         stime = time.time()  # 记录开始时间
         try:
             completion = openai.ChatCompletion.create(
                 model=self.api_model,  # Access api_model using self
-                messages=[{'role': 'system', 'content': self.tune}, {'role': 'user', 'content': text}],  # 系统指令和用户输入
+                messages=[{'role': 'system', 'content': self.get_tune(character)}, {'role': 'user', 'content': text}],  # 系统指令和用户输入
                 stream=True,  # 流式响应
             )
             for chunk in completion:  # 循环处理流式响应
+                if cancel_token and cancel_token.cancelled:
+                    # 用户打断，关闭上游连接，不再读取剩余片段
+                    if hasattr(completion, 'close'):
+                        completion.close()
+                    logging.info('通义千问流式响应已取消，耗时 %.2f 秒' % (time.time() - stime))
+                    return
                 response = chunk.choices[0].delta.content  # 获取响应片段
                 if response:
                     yield response  # 生成器，逐段返回响应
-                time.sleep(0.1)  # 暂停一小段时间
         except openai.error.OpenAIError as e:
             logging.exception(f'通义千问 API 流式传输错误：{e}') # Log the exception for more details
             yield f"错误：通义千问 API 流式传输请求失败: {e}"  # 返回错误信息
         except Exception as e:
             logging.exception(f'未知错误: {e}')  # 日志记录其他异常
-            yield "错误：发生未知错误。"  # 返回错误信息
\ No newline at end of file
+            yield "错误：发生未知错误。"  # 返回错误信息
+
+    def ask_stream_sentences(self, text, character=None, min_len=4, max_len=60, cancel_token=None):
+        # 把流式片段拼成完整句子，每句只需要做一次 TTS
+        stime = time.time()
+        first_token_time = None
+        chunker = SentenceChunker(min_len, max_len)
+        index = 0
+        for delta in self.ask_stream(text, character, cancel_token):
+            if first_token_time is None:
+                first_token_time = time.time() - stime
+                logging.info('通义千问首个片段耗时 %.2f 秒' % first_token_time)
+            for sentence in chunker.feed(delta):
+                yield SentenceEvent(sentence, index, first_token_time, time.time() - stime)
+                index += 1
+        if cancel_token and cancel_token.cancelled:
+            return
+        for sentence in chunker.flush():
+            yield SentenceEvent(sentence, index, first_token_time or 0.0, time.time() - stime)
+            index += 1
+        logging.info('通义千问流式响应共 %i 句，耗时 %.2f 秒' % (index, time.time() - stime))
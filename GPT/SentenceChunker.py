@@ -0,0 +1,70 @@
+from typing import List, NamedTuple
+
+# sentence enders, a cut is made right after them (and after any closing quotes)
+STRONG_BREAKS = set('。！？!?；;…\n')
+# clause breaks, only used when a sentence runs longer than max_len
+WEAK_BREAKS = set('，,、：:')
+CLOSERS = set('"\'”’」』）)】]》')
+
+
+class SentenceEvent(NamedTuple):
+    text: str
+    index: int
+    first_token_time: float  # seconds from request to first token
+    emit_time: float  # seconds from request to this sentence being closed
+
+
+class SentenceChunker():
+    """Aggregates streamed LLM deltas into speakable sentences.
+
+    A sentence closes at Chinese or Western sentence punctuation once it is at
+    least ``min_len`` characters long; shorter ones are merged with the next.
+    A run without punctuation is cut at the last clause break, or hard cut, when
+    it reaches ``max_len``. '.' only counts when followed by whitespace so that
+    numbers like 3.14 stay whole.
+    """
+
+    def __init__(self, min_len=4, max_len=60):
+        self.min_len = min_len
+        self.max_len = max_len
+        self.buffer = ''
+
+    def feed(self, delta: str) -> List[str]:
+        self.buffer += delta
+        sentences = []
+        while True:
+            cut = self._find_cut()
+            if cut is None:
+                return sentences
+            sentence, self.buffer = self.buffer[:cut].strip(), self.buffer[cut:]
+            if sentence:
+                sentences.append(sentence)
+
+    def flush(self) -> List[str]:
+        sentence, self.buffer = self.buffer.strip(), ''
+        return [sentence] if sentence else []
+
+    def _find_cut(self):
+        buf = self.buffer
+        i = 0
+        while i < len(buf):
+            ch = buf[i]
+            if ch in STRONG_BREAKS or (ch == '.' and i + 1 < len(buf) and buf[i + 1].isspace()):
+                end = i + 1
+                while end < len(buf) and (buf[end] in STRONG_BREAKS or buf[end] in CLOSERS):
+                    end += 1
+                if end == len(buf) and ch != '\n':
+                    # more enders or a closing quote may still follow in the next delta
+                    break
+                if len(buf[:end].strip()) >= self.min_len:
+                    return end
+                i = end
+                continue
+            i += 1
+
+        if len(buf) < self.max_len:
+            return None
+        for j in range(self.max_len - 1, self.min_len - 1, -1):
+            if buf[j] in WEAK_BREAKS:
+                return j + 1
+        return self.max_len
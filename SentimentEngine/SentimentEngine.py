@@ -4,13 +4,18 @@ import onnxruntime
 from transformers import BertTokenizer
 import numpy as np
 
+from utils import OnnxGraphCache, OnnxQuantize
+
 
 class SentimentEngine():
-    def __init__(self, model_path):
+    def __init__(self, model_path, optimized_cache=True, precision='fp32'):
         logging.info('Initializing Sentiment Engine...')
-        onnx_model_path = model_path
+        onnx_model_path = OnnxQuantize.model_for_precision(model_path, precision)
 
-        self.ort_session = onnxruntime.InferenceSession(onnx_model_path, providers=['CPUExecutionProvider'])
+        if optimized_cache:
+            self.ort_session = OnnxGraphCache.load_session(onnx_model_path, ['CPUExecutionProvider'])
+        else:
+            self.ort_session = onnxruntime.InferenceSession(onnx_model_path, providers=['CPUExecutionProvider'])
 
         self.tokenizer = BertTokenizer.from_pretrained('bert-base-chinese')
 
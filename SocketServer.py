@@ -1,21 +1,28 @@
 import argparse
+import itertools
 import os
 from pathlib import Path
+import queue
+import selectors
 import socket
 import sys
+import threading
 import time
 import logging
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 from logging.handlers import TimedRotatingFileHandler
 
-import librosa
 import requests
 import revChatGPT
-import soundfile
 
 import GPT.tune
+from utils import FrameProtocol, WavUtils
+from utils.CancelToken import CancelToken
 from utils.FlushingFileHandler import FlushingFileHandler
+from utils.SentencePipeline import SentencePipeline
 from ASR import ASRService
+from ASR.ASRBatchService import ASRBatchService
 from GPT import GPTService
 from TTS import TTService
 from SentimentEngine import SentimentEngine
@@ -66,22 +73,253 @@ def parse_args():
     parser.add_argument("--baseUrl", type=str, nargs='?', required=False)
     parser.add_argument("--brainwash", type=str2bool, nargs='?', required=False)
     parser.add_argument("--llms", type=str, nargs='?', required=False)  # 新增的 --llms 参数
+    parser.add_argument("--protocol", type=str, choices=['legacy', 'framed'], default='legacy',
+                        help="legacy: '?!' sentinel with per-chunk acks; framed: length-prefixed frames")
+    parser.add_argument("--maxSessions", type=int, default=1, help="number of clients served concurrently")
+    parser.add_argument("--ack", type=str2bool, default=False, help="framed protocol: wait for MSG_ACK after each reply")
+    parser.add_argument("--ackTimeout", type=float, default=5.0)
+    parser.add_argument("--asrBatchWindow", type=float, default=20,
+                        help="ms to wait for utterances of other sessions to batch ASR with, 0 disables batching")
+    parser.add_argument("--asrBatchSize", type=int, default=0, help="max utterances per ASR batch, 0 uses config.yaml")
+    parser.add_argument("--asrMinConfidence", type=float, default=0.3,
+                        help="utterances recognized below this confidence get no reply, 0 only skips empty ones")
+    parser.add_argument("--sentimentPrecision", type=str, choices=['fp32', 'int8'], default='fp32')
     return parser.parse_args()
 
 
+class Session():
+    """Per-connection state. Models are owned by the Server and shared by all sessions."""
+    _ids = itertools.count(1)
+
+    def __init__(self, server, conn, addr):
+        self.id = next(self._ids)
+        self.server = server
+        self.conn = conn
+        self.addr = addr
+        self.character = args.character
+        self.send_lock = threading.Lock()
+        self.acks = queue.Queue()
+        self.reply_thread = None
+        self.reply_token = None
+
+    def serve(self):
+        self.send_hello()
+        while True:
+            try:
+                if args.protocol == 'framed':
+                    file = self.__receive_frame()
+                else:
+                    file = self.__receive_file()
+                logging.info('[session %i] WAV received, size %i.' % (self.id, len(file)))
+                # barge-in: a new utterance stops whatever is still being said
+                self.cancel_reply()
+                result = self.process_voice(file)
+                if not self.server.paraformer.accepts(result):
+                    # silence or noise: no LLM call and no TTS, just let the client know the turn is over
+                    self.notice_stream_end()
+                    continue
+                ask_text = result.text
+                cancel_token = CancelToken()
+                if args.protocol == 'framed':
+                    # reply in the background so the receive loop can take the next utterance or a cancel
+                    self.reply_token = cancel_token
+                    self.reply_thread = threading.Thread(target=self.run_reply, args=(ask_text, cancel_token),
+                                                         daemon=True)
+                    self.reply_thread.start()
+                else:
+                    self.reply(ask_text, cancel_token)
+            except ConnectionError as e:
+                # the client went away, nothing unusual
+                logging.info('[session %i] Disconnected: %s' % (self.id, e))
+                break
+            except Exception as e:
+                logging.error(e.__str__())
+                logging.error(traceback.format_exc())
+                break
+        self.cancel_reply()
+
+    def reply(self, ask_text, cancel_token):
+        try:
+            if args.stream:
+                # LLM reading, TTS and sending overlap, see SentencePipeline
+                pipeline = SentencePipeline(self.synthesize, self.server.sentiment.infer, self.send_audio,
+                                            self.server.sentiment_pool)
+                sentences = self.server.chat_gpt.ask_stream_sentences(ask_text, character=self.character,
+                                                                      cancel_token=cancel_token)
+                pipeline.run((event.text for event in sentences), cancel_token)
+                self.notice_stream_end()
+                logging.info('[session %i] Stream %s.' % (self.id, 'cancelled' if cancel_token.cancelled else 'finished'))
+            else:
+                # 检查是否需要使用 LLMService
+                if self.server.llm_service:
+                    llm_response = self.server.llm_service.generate_response(ask_text)
+                else:
+                    # 如果没有 LLMService，使用聊天 GPT 响应
+                    resp_text = self.server.chat_gpt.ask(ask_text, character=self.character)
+                    if not cancel_token.cancelled:
+                        self.send_voice(resp_text)
+                    self.notice_stream_end()
+        except revChatGPT.typings.APIConnectionError as e:
+            logging.error(e.__str__())
+            logging.info('API rate limit exceeded, sending: %s' % GPT.tune.exceed_reply)
+            self.send_voice(GPT.tune.exceed_reply, 2)
+            self.notice_stream_end()
+        except revChatGPT.typings.Error as e:
+            logging.error(e.__str__())
+            logging.info('Something wrong with OPENAI, sending: %s' % GPT.tune.error_reply)
+            self.send_voice(GPT.tune.error_reply, 1)
+            self.notice_stream_end()
+        except requests.exceptions.RequestException as e:
+            logging.error(e.__str__())
+            logging.info('Something wrong with internet, sending: %s' % GPT.tune.error_reply)
+            self.send_voice(GPT.tune.error_reply, 1)
+            self.notice_stream_end()
+
+    def run_reply(self, ask_text, cancel_token):
+        try:
+            self.reply(ask_text, cancel_token)
+        except (ConnectionError, socket.timeout) as e:
+            # a broken connection is noticed by the receive loop
+            logging.error('[session %i] Reply not delivered: %s' % (self.id, e))
+        except Exception as e:
+            logging.error(e.__str__())
+            logging.error(traceback.format_exc())
+            # e.g. TTS or sentiment failed, the client still waits for the end of the reply
+            try:
+                self.notice_stream_end()
+            except OSError:
+                # the connection is gone as well
+                pass
+
+    def cancel_reply(self):
+        """Stop the reply in flight, True if one was still running (it ends with MSG_STREAM_END itself)."""
+        if self.reply_thread is None:
+            return False
+        running = self.reply_thread.is_alive()
+        self.reply_token.cancel()
+        # release a sender waiting for an ack
+        self.acks.put(None)
+        self.reply_thread.join()
+        self.reply_thread = None
+        with self.acks.mutex:
+            self.acks.queue.clear()
+        return running
+
+    def close(self):
+        self.conn.close()
+
+    def send_frame(self, msg_type, payload=b'', arg=0):
+        # the receive loop and the reply thread both send, keep frames whole
+        with self.send_lock:
+            FrameProtocol.send_frame(self.conn, msg_type, payload, arg)
+
+    def send_hello(self):
+        char_id = self.server.char_name[self.character][2].encode()
+        if args.protocol == 'framed':
+            self.send_frame(FrameProtocol.MSG_HELLO, char_id)
+        else:
+            self.conn.sendall(b'%s' % char_id)
+
+    def notice_stream_end(self):
+        if args.protocol == 'framed':
+            self.send_frame(FrameProtocol.MSG_STREAM_END)
+        else:
+            # legacy clients tell messages apart by timing, keep them from being merged
+            time.sleep(0.5)
+            self.conn.sendall(b'stream_finished')
+
+    def send_voice(self, resp_text, senti_or = None):
+        if senti_or:
+            self.send_audio(self.synthesize(resp_text), senti_or)
+            return
+        senti = self.server.sentiment_pool.submit(self.server.sentiment.infer, resp_text)
+        senddata = self.synthesize(resp_text)
+        self.send_audio(senddata, senti.result())
+
+    def synthesize(self, resp_text):
+        tts = self.server.get_tts(self.character)
+        with self.server.tts_lock:
+            # WAV bytes straight from memory, no temp file per session
+            return tts.read_bytes(resp_text)
+
+    def send_audio(self, senddata, senti):
+        if args.protocol == 'framed':
+            self.send_frame(FrameProtocol.MSG_AUDIO, senddata, arg=int(senti))
+            if args.ack:
+                self.wait_ack()
+        else:
+            senddata += b'?!'
+            senddata += b'%i' % senti
+            self.conn.sendall(senddata)
+            time.sleep(0.5)
+        logging.info('[session %i] WAV SENT, size %i' % (self.id, len(senddata)))
+
+    def wait_ack(self):
+        try:
+            self.acks.get(timeout=args.ackTimeout)
+        except queue.Empty:
+            logging.warning('[session %i] No ack within %.1fs, sending on.' % (self.id, args.ackTimeout))
+
+    def __receive_file(self):
+        # legacy protocol: 1024 byte chunks, one ack per chunk, '?!' terminates the upload
+        file_data = bytearray()
+        while True:
+            data = self.conn.recv(1024)
+            # print(data)
+            if not data:
+                raise ConnectionError('Client closed the connection.')
+            self.conn.send(b'sb')
+            if data[-2:] == b'?!':
+                file_data += data[0:-2]
+                break
+            file_data += data
+
+        return file_data
+
+    def __receive_frame(self):
+        while True:
+            msg_type, _, payload = FrameProtocol.read_frame(self.conn)
+            if msg_type == FrameProtocol.MSG_AUDIO:
+                return payload
+            if msg_type == FrameProtocol.MSG_HELLO:
+                # the client picks a character for this session
+                character = bytes(payload).decode()
+                if character in self.server.char_name:
+                    self.character = character
+                    logging.info('[session %i] Character set to %s.' % (self.id, character))
+                else:
+                    logging.warning('[session %i] Unknown character %s.' % (self.id, character))
+                self.send_hello()
+                continue
+            if msg_type == FrameProtocol.MSG_ACK:
+                self.acks.put(None)
+                continue
+            if msg_type == FrameProtocol.MSG_CANCEL:
+                logging.info('[session %i] Reply cancelled by client.' % self.id)
+                if not self.cancel_reply():
+                    # nothing was playing, still answer every cancel with a stream end
+                    self.notice_stream_end()
+                continue
+            logging.warning('Ignoring frame of type %i.' % msg_type)
+
+    def process_voice(self, wav_bytes):
+        # all in memory, ASR downmixes and resamples (a no-op for 16 kHz uploads)
+        y, sr = WavUtils.parse_wav(wav_bytes)
+        return self.server.paraformer.infer(y, fs=sr)
+
+
 class Server():
     def __init__(self, args):
         # SERVER STUFF
-        self.addr = None
-        self.conn = None
         logging.info('Initializing Server...')
         self.host = socket.gethostbyname(socket.gethostname())
         self.port = 38438
         self.s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.s.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 10240000)
         self.s.bind((self.host, self.port))
-        self.tmp_recv_file = 'tmp/server_received.wav'
-        self.tmp_proc_file = 'tmp/server_processed.wav'
+        # at most this many clients are served at once, the rest wait in the listen backlog
+        self.session_slots = threading.BoundedSemaphore(args.maxSessions)
+        self.sessions = {}
 
         ## hard coded character map
         self.char_name = {
@@ -92,7 +330,13 @@ class Server():
         }
 
         # PARAFORMER
-        self.paraformer = ASRService.ASRService('./ASR/resources/config.yaml')
+        if args.asrBatchWindow > 0:
+            self.paraformer = ASRBatchService('./ASR/resources/config.yaml', max_batch=args.asrBatchSize,
+                                              window=args.asrBatchWindow / 1000,
+                                              min_confidence=args.asrMinConfidence)
+        else:
+            self.paraformer = ASRService.ASRService('./ASR/resources/config.yaml',
+                                                    min_confidence=args.asrMinConfidence)
 
         # LLM
 
@@ -103,11 +347,14 @@ class Server():
         # CHAT GPT
         self.chat_gpt = GPTService.GPTService(args)
 
-        # TTS
-        self.tts = TTService.TTService(*self.char_name[args.character])
+        # TTS, one model per character, loaded on first use and shared by all sessions
+        self.tts_lock = threading.Lock()
+        self.tts_models = {args.character: TTService.TTService(*self.char_name[args.character])}
 
-        # Sentiment Engine
-        self.sentiment = SentimentEngine.SentimentEngine('SentimentEngine/models/paimon_sentiment.onnx')
+        # Sentiment Engine, runs next to TTS on its own threads
+        self.sentiment = SentimentEngine.SentimentEngine('SentimentEngine/models/paimon_sentiment.onnx',
+                                                         precision=args.sentimentPrecision)
+        self.sentiment_pool = ThreadPoolExecutor(max_workers=args.maxSessions, thread_name_prefix='sentiment')
 
             # 创建 TTS 服务实例
         self.tts_service = TTSService.TTService(
@@ -119,113 +366,45 @@ class Server():
         # LLM Service（仅在没有 API 密钥的情况下初始化）
         self.llm_service = LLMService(args.llms) if not args.APIKey else None
 
+    def get_tts(self, character):
+        with self.tts_lock:
+            if character not in self.tts_models:
+                self.tts_models[character] = TTService.TTService(*self.char_name[character])
+            return self.tts_models[character]
+
     def listen(self):
         # MAIN SERVER LOOP
+        self.s.listen()
+        self.s.setblocking(False)
+        selector = selectors.DefaultSelector()
+        selector.register(self.s, selectors.EVENT_READ)
+        logging.info(f"Server is listening on {self.host}:{self.port}, up to {args.maxSessions} sessions...")
         while True:
-            self.s.listen()
-            logging.info(f"Server is listening on {self.host}:{self.port}...")
-            self.conn, self.addr = self.s.accept()
-            logging.info(f"Connected by {self.addr}")
-            self.conn.sendall(b'%s' % self.char_name[args.character][2].encode())
-            while True:
-                try:
-                    file = self.__receive_file()
-                    with open(self.tmp_recv_file, 'wb') as f:
-                        f.write(file)
-                        logging.info('WAV file received and saved.')
-                    ask_text = self.process_voice()
-                    if args.stream:
-                        for sentence in self.chat_gpt.ask_stream(ask_text):
-                            self.send_voice(sentence)
-                        self.notice_stream_end()
-                        logging.info('Stream finished.')
-                    else:
-                        # 检查是否需要使用 LLMService
-                        if self.llm_service:
-                            llm_response = self.llm_service.generate_response(ask_text)
-                        else:
-                            # 如果没有 LLMService，使用聊天 GPT 响应
-                            resp_text = self.chat_gpt.ask(ask_text)
-                            self.send_voice(resp_text)
-                            self.notice_stream_end()
-                except revChatGPT.typings.APIConnectionError as e:
-                    logging.error(e.__str__())
-                    logging.info('API rate limit exceeded, sending: %s' % GPT.tune.exceed_reply)
-                    self.send_voice(GPT.tune.exceed_reply, 2)
-                    self.notice_stream_end()
-                except revChatGPT.typings.Error as e:
-                    logging.error(e.__str__())
-                    logging.info('Something wrong with OPENAI, sending: %s' % GPT.tune.error_reply)
-                    self.send_voice(GPT.tune.error_reply, 1)
-                    self.notice_stream_end()
-                except requests.exceptions.RequestException as e:
-                    logging.error(e.__str__())
-                    logging.info('Something wrong with internet, sending: %s' % GPT.tune.error_reply)
-                    self.send_voice(GPT.tune.error_reply, 1)
-                    self.notice_stream_end()
-                except Exception as e:
-                    logging.error(e.__str__())
-                    logging.error(traceback.format_exc())
-                    break
-
-    def notice_stream_end(self):
-        time.sleep(0.5)
-        self.conn.sendall(b'stream_finished')
-
-    def send_voice(self, resp_text, senti_or = None):
-        # 使用新的 TTS 服务生成音频
-        self.tts.generate_audio(resp_text)
-        # 保存生成的音频到临时文件
-        self.tts.save_audio(output_filename=self.tmp_proc_file)
-        with open(self.tmp_proc_file, 'rb') as f:
-            senddata = f.read()
-        if senti_or:
-            senti = senti_or
-        else:
-            senti = self.sentiment.infer(resp_text)
-        senddata += b'?!'
-        senddata += b'%i' % senti
-        self.conn.sendall(senddata)
-        time.sleep(0.5)
-        logging.info('WAV SENT, size %i' % len(senddata))
-
-    def __receive_file(self):
-        file_data = b''
-        while True:
-            data = self.conn.recv(1024)
-            # print(data)
-            self.conn.send(b'sb')
-            if data[-2:] == b'?!':
-                file_data += data[0:-2]
-                break
-            if not data:
-                # logging.info('Waiting for WAV...')
+            # wait for a free slot and a client with timeouts, so that Ctrl+C is not swallowed
+            # by a blocking acquire or accept
+            while not self.session_slots.acquire(timeout=1):
+                pass
+            while not selector.select(timeout=1):
+                pass
+            try:
+                conn, addr = self.s.accept()
+            except BlockingIOError:
+                self.session_slots.release()
                 continue
-            file_data += data
-
-        return file_data
+            conn.setblocking(True)
+            session = Session(self, conn, addr)
+            self.sessions[session.id] = session
+            logging.info(f"Connected by {addr}, session {session.id}, {len(self.sessions)} active")
+            threading.Thread(target=self.run_session, args=(session,), daemon=True).start()
 
-    def fill_size_wav(self):
-        with open(self.tmp_recv_file, "r+b") as f:
-            # Get the size of the file
-            size = os.path.getsize(self.tmp_recv_file) - 8
-            # Write the size of the file to the first 4 bytes
-            f.seek(4)
-            f.write(size.to_bytes(4, byteorder='little'))
-            f.seek(40)
-            f.write((size - 28).to_bytes(4, byteorder='little'))
-            f.flush()
-
-    def process_voice(self):
-        # stereo to mono
-        self.fill_size_wav()
-        y, sr = librosa.load(self.tmp_recv_file, sr=None, mono=False)
-        y_mono = librosa.to_mono(y)
-        y_mono = librosa.resample(y_mono, orig_sr=sr, target_sr=16000)
-        soundfile.write(self.tmp_recv_file, y_mono, 16000)
-        text = self.paraformer.infer(self.tmp_recv_file)
-
-        return text
+    def run_session(self, session):
+        try:
+            session.serve()
+        finally:
+            session.close()
+            self.sessions.pop(session.id, None)
+            self.session_slots.release()
+            logging.info(f"Session {session.id} closed, {len(self.sessions)} active")
 
 
 if __name__ == '__main__':
@@ -1,3 +1,4 @@
+import io
 import sys
 import time
 
@@ -57,6 +58,10 @@ class TTService():
         soundfile.write(filename, au, sr)
         logging.info('VITS Synth Done, time used %.2f' % (time.time() - stime))
 
-
-
-
+    def read_bytes(self, text):
+        stime = time.time()
+        au = self.read(text)
+        buf = io.BytesIO()
+        soundfile.write(buf, au, self.hps.data.sampling_rate, format='WAV')
+        logging.info('VITS Synth Done, time used %.2f' % (time.time() - stime))
+        return buf.getvalue()
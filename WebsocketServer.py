@@ -1,20 +1,22 @@
 import argparse
 import asyncio
-import os
 import logging
 import traceback
 import json
 from logging.handlers import TimedRotatingFileHandler
 
-import librosa
 import requests
 import revChatGPT
-import soundfile
 import websockets
 
 import GPT.tune
+from GPT.SentenceChunker import SentenceChunker
+from utils import AudioFrame, WavUtils
+from utils.CancelToken import CancelToken
 from utils.FlushingFileHandler import FlushingFileHandler
+from utils.StageExecutor import StageExecutor
 from ASR import ASRService
+from ASR.ASRBatchService import ASRBatchService
 from GPT import GPTService
 from TTS import TTService
 from SentimentEngine import SentimentEngine
@@ -56,6 +58,18 @@ def parse_args():
     parser.add_argument("--baseUrl", type=str, nargs='?', required=False)
     parser.add_argument("--brainwash", type=str2bool, nargs='?', required=False)
     parser.add_argument("--port", type=int, default=8765, help="WebSocket port")  # Add WebSocket port argument
+    parser.add_argument("--binaryAudio", type=str2bool, default=False,
+                        help="send audio replies as binary frames instead of JSON")
+    parser.add_argument("--asrWorkers", type=int, default=3, help="concurrent ASR calls, batched together by ASRBatchService")
+    parser.add_argument("--llmWorkers", type=int, default=4)
+    parser.add_argument("--ttsWorkers", type=int, default=1)
+    parser.add_argument("--stageQueue", type=int, default=8, help="calls allowed to wait per stage")
+    parser.add_argument("--asrBatchWindow", type=float, default=20,
+                        help="ms to wait for utterances of other sessions to batch ASR with, 0 disables batching")
+    parser.add_argument("--asrBatchSize", type=int, default=0, help="max utterances per ASR batch, 0 uses config.yaml")
+    parser.add_argument("--asrMinConfidence", type=float, default=0.3,
+                        help="utterances recognized below this confidence get no reply, 0 only skips empty ones")
+    parser.add_argument("--sentimentPrecision", type=str, choices=['fp32', 'int8'], default='fp32')
     return parser.parse_args()
 
 
@@ -64,15 +78,19 @@ class Server():
         # ... (Initialization of ASR, GPT, TTS, SentimentEngine remains the same)
 
         self.port = args.port  # Use the port from arguments
-        self.tmp_recv_file = 'tmp/server_received.wav'
-        self.tmp_proc_file = 'tmp/server_processed.wav'
         self.char_name = {  # CORRECTLY INITIALIZE char_name HERE
             'paimon': ['TTS/models/paimon6k.json', 'TTS/models/paimon6k_390k.pth', 'character_paimon', 1],
             'yunfei': ['TTS/models/yunfeimix2.json', 'TTS/models/yunfeimix2_53k.pth', 'character_yunfei', 1.1],
             'catmaid': ['TTS/models/catmix.json', 'TTS/models/catmix_107k.pth', 'character_catmaid', 1.2]
         }
         # PARAFORMER
-        self.paraformer = ASRService.ASRService('./ASR/resources/config.yaml')
+        if args.asrBatchWindow > 0:
+            self.paraformer = ASRBatchService('./ASR/resources/config.yaml', max_batch=args.asrBatchSize,
+                                              window=args.asrBatchWindow / 1000,
+                                              min_confidence=args.asrMinConfidence)
+        else:
+            self.paraformer = ASRService.ASRService('./ASR/resources/config.yaml',
+                                                    min_confidence=args.asrMinConfidence)
 
         # LLM
         self.chat_gpt = GPTService.GPTService(args)
@@ -81,124 +99,214 @@ class Server():
         self.tts = TTService.TTService(*self.char_name[args.character])
 
         # Sentiment Engine
-        self.sentiment = SentimentEngine.SentimentEngine('SentimentEngine/models/paimon_sentiment.onnx')
+        self.sentiment = SentimentEngine.SentimentEngine('SentimentEngine/models/paimon_sentiment.onnx',
+                                                         precision=args.sentimentPrecision)
 
+        # model calls run on per-stage thread pools, the event loop only does I/O
+        self.stages = StageExecutor({'asr': args.asrWorkers, 'llm': args.llmWorkers, 'tts': args.ttsWorkers},
+                                    queue_size=args.stageQueue)
 
     async def handler(self, websocket, char_name):  # Add char_name as parameter
         logging.info(f"New client connected: {websocket.remote_address}")
         print(dir(self))
         await websocket.send(char_name[args.character][2])
+        # clients that upload binary frames get binary replies as well
+        binary = args.binaryAudio
+        # the reply in flight; a new utterance or a cancel message stops it (barge-in)
+        reply_task, reply_token = None, None
+
+        async def cancel_reply():
+            nonlocal reply_task
+            if reply_task is None or reply_task.done():
+                return
+            reply_token.cancel()
+            reply_task.cancel()
+            try:
+                await reply_task
+            except asyncio.CancelledError:
+                pass
+            reply_task = None
+            await websocket.send(json.dumps({"type": "stream_end", "cancelled": True}))
+
+        def start_reply(ask_text):
+            nonlocal reply_task, reply_token
+            reply_token = CancelToken()
+            reply_task = asyncio.create_task(self.reply(websocket, ask_text, binary, reply_token))
+
+        async def start_voice_reply(result):
+            if not self.paraformer.accepts(result):
+                # silence or noise: no LLM call and no TTS, just end the turn
+                await websocket.send(json.dumps({"type": "stream_end", "skipped": True}))
+                return
+            start_reply(result.text)
+
         async for message in websocket:
 
             try:
+                if isinstance(message, bytes):
+                    binary = True
+                    y, sr, _ = AudioFrame.decode(message)
+                    logging.info('Binary audio received, size %i.' % len(message))
+                    await cancel_reply()
+                    result = await self.stages.run('asr', self.process_samples, y, sr)
+                    await start_voice_reply(result)
+                    continue
+
                 data = json.loads(message)
-                if data["type"] == "audio":
+                if data["type"] == "config":
+                    binary = bool(data.get("binary", binary))
+
+                elif data["type"] == "cancel":
+                    logging.info('Reply cancelled by client.')
+                    await cancel_reply()
+
+                elif data["type"] == "audio":
                     audio_data = bytes.fromhex(data["data"])
-                    with open(self.tmp_recv_file, 'wb') as f:
-                        f.write(audio_data)
-                    logging.info('WAV file received and saved.')
-                    ask_text = self.process_voice()
+                    logging.info('WAV received, size %i.' % len(audio_data))
+                    await cancel_reply()
+                    result = await self.stages.run('asr', self.process_voice, audio_data)
+                    await start_voice_reply(result)
 
                 elif data["type"] == "text":  # Handle text messages
                     ask_text = data["data"]
                     logging.info(f"Received text message: {ask_text}")
+                    await cancel_reply()
 
                     # Process the text message (e.g., send to GPT-3, etc.)
                     receive_text = f"Server received: {ask_text}"  # Example response
-                    respond_text = self.chat_gpt.ask(ask_text)
-                    # Send the response back to the client
                     await websocket.send(json.dumps({
                         "type": "text_receive",
                         "data": receive_text
                     }))
+                    start_reply(ask_text)
 
-                    # Send the response back to the client
-                    await websocket.send(json.dumps({
-                        "type": "text_respond",
-                        "data": respond_text
-                    }))
-
-                    if args.stream:
-                        async for sentence in self.chat_gpt.ask_stream(ask_text):
-                            await self.send_voice(websocket, sentence)
-                        await self.notice_stream_end(websocket)
-                    else:
-                        resp_text = self.chat_gpt.ask(ask_text)
-                        await self.send_voice(websocket, resp_text)
-                        await self.notice_stream_end(websocket)
-
-            except (json.JSONDecodeError, KeyError) as e:
+            except (json.JSONDecodeError, KeyError, AudioFrame.AudioFrameError, WavUtils.WavFormatError) as e:
                 logging.error(f"Invalid message format: {e}")
                 await websocket.send(json.dumps({"error": "Invalid message format"}))
 
-            except (revChatGPT.typings.APIConnectionError,
-                    revChatGPT.typings.Error, requests.exceptions.RequestException) as e:
-                logging.error(e.__str__())
-                await self.send_error(websocket, GPT.tune.error_reply, 1)
-
             except Exception as e:
                 logging.error(e.__str__())
                 logging.error(traceback.format_exc())
                 await websocket.send(json.dumps({"error": "Internal server error"}))
 
+        if reply_task is not None:
+            reply_token.cancel()
+            reply_task.cancel()
+
+    async def reply(self, websocket, ask_text, binary, cancel_token):
+        try:
+            await self.respond(websocket, ask_text, binary, cancel_token)
+
+        except (revChatGPT.typings.APIConnectionError,
+                revChatGPT.typings.Error, requests.exceptions.RequestException) as e:
+            logging.error(e.__str__())
+            await self.send_error(websocket, GPT.tune.error_reply, 1, binary=binary)
+
+        except websockets.ConnectionClosed:
+            logging.info('Client left during the reply.')
+
+        except Exception as e:
+            logging.error(e.__str__())
+            logging.error(traceback.format_exc())
+            await websocket.send(json.dumps({"error": "Internal server error"}))
+
+    async def respond(self, websocket, ask_text, binary=False, cancel_token=None):
+        # one streamed LLM call: deltas go to the screen right away and, sentence by sentence, to TTS
+        chunker = SentenceChunker()
+        sentences = asyncio.Queue(maxsize=4)
+        respond_text = []
+
+        async def speak():
+            while True:
+                sentence = await sentences.get()
+                if sentence is None or (cancel_token and cancel_token.cancelled):
+                    return
+                await self.send_voice(websocket, sentence, binary=binary)
+
+        async def put(sentence):
+            # surface TTS/send errors instead of waiting on a queue nobody drains
+            putter = asyncio.ensure_future(sentences.put(sentence))
+            await asyncio.wait({putter, speaker}, return_when=asyncio.FIRST_COMPLETED)
+            if not putter.done():
+                putter.cancel()
+                await speaker
+
+        speaker = asyncio.create_task(speak())
+        try:
+            async for delta in self.stages.iterate('llm', self.chat_gpt.ask_stream(ask_text, cancel_token=cancel_token)):
+                respond_text.append(delta)
+                await websocket.send(json.dumps({
+                    "type": "text_delta",
+                    "data": delta
+                }))
+                if args.stream:
+                    for sentence in chunker.feed(delta):
+                        await put(sentence)
+
+            respond_text = ''.join(respond_text)
+            await websocket.send(json.dumps({
+                "type": "text_respond",
+                "data": respond_text
+            }))
+            for sentence in (chunker.flush() if args.stream else [respond_text]):
+                # an empty reply has nothing to synthesize or rate
+                if sentence.strip():
+                    await put(sentence)
+            await put(None)
+            await speaker
+        finally:
+            speaker.cancel()
+        await self.notice_stream_end(websocket)
+
     async def notice_stream_end(self, websocket):
         await websocket.send(json.dumps({"type": "stream_end"}))
 
-    async def send_voice(self, websocket, resp_text, senti_or=None):
-        self.tts.read_save(resp_text, self.tmp_proc_file, self.tts.hps.data.sampling_rate)
-        with open(self.tmp_proc_file, 'rb') as f:
-            sendData = f.read()
-
+    async def get_sentiment(self, text, senti_or=None):
         if senti_or:
-            senti = senti_or
-        else:
-            senti = self.sentiment.infer(resp_text)
+            return senti_or
+        return await self.stages.run('sentiment', self.sentiment.infer, text)
+
+    async def send_voice(self, websocket, resp_text, senti_or=None, binary=False):
+        if binary:
+            # TTS and sentiment run side by side, the audio never touches the disk
+            sendData, senti = await asyncio.gather(self.stages.run('tts', self.tts.read_bytes, resp_text),
+                                                   self.get_sentiment(resp_text, senti_or))
+            await websocket.send(AudioFrame.encode(sendData, sentiment=int(senti)))
+            logging.info('WAV SENT, size %i' % len(sendData))
+            return
+
+        # in memory like send_error, concurrent clients must not share a temp file
+        sendData, senti = await asyncio.gather(self.stages.run('tts', self.tts.read_bytes, resp_text),
+                                               self.get_sentiment(resp_text, senti_or))
 
         await websocket.send(json.dumps({
             "type": "audio_response",
-            "data": "tmp/server_received.wav",
-            #"data": sendData.hex(),
+            "data": sendData.hex(),
             "sentiment": int(senti)
         }))
+        logging.info('WAV SENT, size %i' % len(sendData))
 
-        #logging.info('WAV SENT, size %i' % len(senddata))
-        logging.info('音频地址已发送')
-
-    # ... (process_voice, fill_size_wav remain the same)
-
-    async def send_error(self, websocket, message, sentiment):
+    async def send_error(self, websocket, message, sentiment, binary=False):
         # Synthesize the error message to speech
-        self.tts.read_save(message, self.tmp_proc_file, self.tts.hps.data.sampling_rate)
-        with open(self.tmp_proc_file, 'rb') as f:
-            senddata = f.read()
+        senddata = await self.stages.run('tts', self.tts.read_bytes, message)
 
-        await websocket.send(json.dumps({
-            "type": "audio_response",
-            "data": senddata.hex(),
-            "sentiment": sentiment
-        }))
+        if binary:
+            await websocket.send(AudioFrame.encode(senddata, sentiment=sentiment))
+        else:
+            await websocket.send(json.dumps({
+                "type": "audio_response",
+                "data": senddata.hex(),
+                "sentiment": sentiment
+            }))
         await self.notice_stream_end(websocket)
 
-    def fill_size_wav(self):
-        with open(self.tmp_recv_file, "r+b") as f:
-            # Get the size of the file
-            size = os.path.getsize(self.tmp_recv_file) - 8
-            # Write the size of the file to the first 4 bytes
-            f.seek(4)
-            f.write(size.to_bytes(4, byteorder='little'))
-            f.seek(40)
-            f.write((size - 28).to_bytes(4, byteorder='little'))
-            f.flush()
-
-    def process_voice(self):
-        self.fill_size_wav()
-        y, sr = librosa.load(self.tmp_recv_file, sr=None, mono=False)
-        y_mono = librosa.to_mono(y)
-        y_mono = librosa.resample(y_mono, orig_sr=sr, target_sr=16000)
-        soundfile.write(self.tmp_recv_file, y_mono, 16000)
-        text = self.paraformer.infer(self.tmp_recv_file)
-
-        return text
+    def process_voice(self, wav_bytes):
+        y, sr = WavUtils.parse_wav(wav_bytes)
+        return self.process_samples(y, sr)
+
+    def process_samples(self, y, sr):
+        # int16 or float32 PCM, ASR downmixes and resamples (a no-op for 16 kHz clients)
+        return self.paraformer.infer(y, fs=sr)
 
     async def run(self):
         async with websockets.serve(lambda websocket: self.handler(websocket, self.char_name), "0.0.0.0",
@@ -0,0 +1,49 @@
+"""
+特征提取线程池基准：一个 batch 内逐条提取 vs 线程池并行提取
+
+用法: python -m examples.bench_extract_feat --workers 4 --batch 3 8 16
+并行耗时应随核数增加接近单条最长语音的耗时。
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from ASR.rapid_paraformer.utils import WavFrontend, read_yaml
+
+
+def timed(fn, repeat):
+    costs = []
+    for _ in range(repeat):
+        stime = time.perf_counter()
+        fn()
+        costs.append(time.perf_counter() - stime)
+    return np.median(costs)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--config', type=str, default='ASR/resources/config.yaml')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--batch', type=int, nargs='+', default=[3, 8, 16])
+    parser.add_argument('--seconds', type=float, nargs=2, default=[2.0, 8.0], help='min/max utterance length')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    config = read_yaml(args.config)
+    frontend = WavFrontend(cmvn_file=config['WavFrontend']['cmvn_file'], **config['WavFrontend']['frontend_conf'])
+    pool = ThreadPoolExecutor(args.workers)
+    rng = np.random.default_rng(0)
+
+    print('batch  serial(ms)  pool(ms)  slowest single(ms)  speedup')
+    for batch in args.batch:
+        lengths = rng.uniform(*args.seconds, size=batch) * frontend.fs
+        waveforms = [(rng.standard_normal(int(n)) * 0.1).astype(np.float32)[None, :] for n in lengths]
+        longest = waveforms[int(np.argmax(lengths))]
+
+        serial = timed(lambda: [frontend.features(w) for w in waveforms], args.repeat)
+        pooled = timed(lambda: list(pool.map(frontend.features, waveforms)), args.repeat)
+        slowest = timed(lambda: frontend.features(longest), args.repeat)
+        print('%5i  %10.1f  %8.1f  %18.1f  %7.1fx' % (batch, serial * 1000, pooled * 1000, slowest * 1000, serial / pooled))
+    pool.shutdown()
@@ -0,0 +1,43 @@
+"""
+extract_window 微基准：整句矩阵化实现 vs 逐帧循环实现
+
+用法: python -m examples.bench_extract_window --seconds 10 --repeat 20
+"""
+import argparse
+import time
+
+import numpy as np
+
+from ASR.rapid_paraformer.kaldifeat.feature import extract_window, extract_window_loop
+
+
+def bench(fn, waveform, repeat, **kwargs):
+    fn(waveform.copy(), **kwargs)
+    costs = []
+    for _ in range(repeat):
+        stime = time.perf_counter()
+        fn(waveform, **kwargs)
+        costs.append(time.perf_counter() - stime)
+    return np.median(costs)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seconds', type=float, default=10.0)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    waveform = (np.random.randn(int(16000 * args.seconds)) * 3000).astype(np.float32)
+    kwargs = dict(blackman_coeff=0.42, dither=0.0, window_size=400, window_shift=160,
+                  preemphasis_coefficient=0.97, raw_energy=True, remove_dc_offset=True,
+                  snip_edges=True, window_type='hamming', dtype=np.float32)
+
+    frames, _ = extract_window(waveform, **kwargs)
+    frames_ref, _ = extract_window_loop(waveform, **kwargs)
+    print('frames: %i, max abs diff: %.3g' % (frames.shape[0], np.abs(frames - frames_ref).max()))
+
+    loop = bench(extract_window_loop, waveform, args.repeat, **kwargs)
+    vec = bench(extract_window, waveform, args.repeat, **kwargs)
+    print('loop:       %.2f ms' % (loop * 1000))
+    print('vectorized: %.2f ms' % (vec * 1000))
+    print('speedup:    %.1fx' % (loop / vec))
@@ -0,0 +1,94 @@
+"""
+fp32 与 int8 模型的精度和延迟对比
+
+ASR: 目录中每个 <name>.wav 配一个 <name>.txt 参考文本，输出两种精度的字错误率 (CER) 和平均延迟
+    python -m examples.compare_precision asr --wavDir path/to/wavs
+情感: 文本文件每行一句，输出 int8 与 fp32 预测一致的比例和平均延迟
+    python -m examples.compare_precision sentiment --texts path/to/texts.txt
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from ASR.rapid_paraformer.utils import read_yaml
+
+ASR_CONFIG = 'ASR/resources/config.yaml'
+SENTIMENT_MODEL = 'SentimentEngine/models/paimon_sentiment.onnx'
+
+
+def edit_distance(ref, hyp):
+    row = list(range(len(hyp) + 1))
+    for i, r in enumerate(ref, 1):
+        prev, row[0] = row[0], i
+        for j, h in enumerate(hyp, 1):
+            prev, row[j] = row[j], min(row[j] + 1, row[j - 1] + 1, prev + (r != h))
+    return row[-1]
+
+
+def normalize(text):
+    return ''.join(ch for ch in text if ch.isalnum()).lower()
+
+
+def load_asr(precision):
+    import yaml
+    from ASR.ASRService import load_session
+    from ASR.rapid_paraformer import RapidParaformer
+
+    config = read_yaml(ASR_CONFIG)
+    config['Model']['precision'] = precision
+    with tempfile.NamedTemporaryFile('w', suffix='.yaml', delete=False) as f:
+        yaml.dump(config, f, allow_unicode=True)
+    try:
+        return RapidParaformer(f.name, session_factory=load_session)
+    finally:
+        os.remove(f.name)
+
+
+def compare_asr(wav_dir):
+    names = sorted(os.path.splitext(name)[0] for name in os.listdir(wav_dir) if name.endswith('.wav'))
+    refs = {}
+    for name in names:
+        with open(os.path.join(wav_dir, name + '.txt'), encoding='utf-8') as f:
+            refs[name] = normalize(f.read())
+
+    for precision in ('fp32', 'int8'):
+        paraformer = load_asr(precision)
+        errors, chars, cost = 0, 0, 0.0
+        for name in names:
+            stime = time.perf_counter()
+            hyp = paraformer(os.path.join(wav_dir, name + '.wav'))
+            cost += time.perf_counter() - stime
+            errors += edit_distance(refs[name], normalize(hyp[0] if hyp else ''))
+            chars += len(refs[name])
+        print('%s  CER %.2f%%  latency %.1f ms/utt  (%i files)' % (
+            precision, 100.0 * errors / max(1, chars), 1000 * cost / max(1, len(names)), len(names)))
+
+
+def compare_sentiment(texts_path):
+    from SentimentEngine.SentimentEngine import SentimentEngine
+
+    with open(texts_path, encoding='utf-8') as f:
+        texts = [line.strip() for line in f if line.strip()]
+    predictions = {}
+    for precision in ('fp32', 'int8'):
+        engine = SentimentEngine(SENTIMENT_MODEL, precision=precision)
+        stime = time.perf_counter()
+        predictions[precision] = [engine.infer(text) for text in texts]
+        cost = time.perf_counter() - stime
+        print('%s  latency %.2f ms/text' % (precision, 1000 * cost / max(1, len(texts))))
+    agree = sum(a == b for a, b in zip(predictions['fp32'], predictions['int8']))
+    print('agreement %.2f%% (%i/%i)' % (100.0 * agree / max(1, len(texts)), agree, len(texts)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest='model', required=True)
+    sub.add_parser('asr').add_argument('--wavDir', type=str, required=True)
+    sub.add_parser('sentiment').add_argument('--texts', type=str, required=True)
+    args = parser.parse_args()
+
+    if args.model == 'asr':
+        compare_asr(args.wavDir)
+    else:
+        compare_sentiment(args.texts)
@@ -0,0 +1,24 @@
+"""
+生成 Paraformer 与情感模型的动态 INT8 版本（model.int8.onnx / paimon_sentiment.int8.onnx）
+
+用法: python -m examples.quantize_models [--perChannel true]
+之后在 ASR/resources/config.yaml 中设置 precision: int8，服务器加 --sentimentPrecision int8。
+需要 onnx 包: pip install onnx
+"""
+import argparse
+import logging
+
+from utils import OnnxQuantize
+
+MODELS = ['ASR/resources/models/model.onnx', 'SentimentEngine/models/paimon_sentiment.onnx']
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--models', type=str, nargs='+', default=MODELS)
+    parser.add_argument('--perChannel', type=lambda v: v.lower() in ('yes', 'true', 't', 'y', '1'), default=False)
+    args = parser.parse_args()
+
+    for model_path in args.models:
+        OnnxQuantize.quantize(model_path, per_channel=args.perChannel)
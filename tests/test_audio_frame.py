@@ -0,0 +1,37 @@
+import unittest
+
+import numpy as np
+
+from utils import AudioFrame
+
+
+class TestAudioFrame(unittest.TestCase):
+    def test_pcm16_zero_copy(self):
+        """测试 PCM16 帧零拷贝解码"""
+        pcm = np.arange(-100, 100, dtype='<i2')
+        message = AudioFrame.encode(pcm.tobytes(), AudioFrame.CODEC_PCM16, 16000, 2)
+        samples, sr, sentiment = AudioFrame.decode(message)
+        self.assertEqual(sr, 16000)
+        self.assertEqual(sentiment, -1)
+        self.assertEqual(samples.shape, (2, 100))
+        np.testing.assert_array_equal(samples[0], pcm[0::2])
+        self.assertFalse(samples.base is None)
+
+    def test_float32(self):
+        """测试 float32 帧解码"""
+        pcm = np.linspace(-1, 1, 320, dtype='<f4')
+        message = AudioFrame.encode(pcm.tobytes(), AudioFrame.CODEC_FLOAT32, 16000, 1, sentiment=2)
+        samples, _, sentiment = AudioFrame.decode(message)
+        self.assertEqual(sentiment, 2)
+        np.testing.assert_array_equal(samples[0], pcm)
+
+    def test_invalid(self):
+        """测试非法帧"""
+        with self.assertRaises(AudioFrame.AudioFrameError):
+            AudioFrame.decode(b'RIFF')
+        with self.assertRaises(AudioFrame.AudioFrameError):
+            AudioFrame.decode(AudioFrame.encode(b'\0' * 4, AudioFrame.CODEC_PCM16))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import socket
+import threading
+import unittest
+
+from utils import FrameProtocol
+
+
+class TestFrameProtocol(unittest.TestCase):
+    def setUp(self):
+        self.server, self.client = socket.socketpair()
+
+    def tearDown(self):
+        self.server.close()
+        self.client.close()
+
+    def test_roundtrip(self):
+        """测试帧的收发"""
+        payload = bytes(range(256)) * 1000
+        sender = threading.Thread(target=FrameProtocol.send_frame,
+                                  args=(self.client, FrameProtocol.MSG_AUDIO, payload, 3))
+        sender.start()
+        msg_type, arg, data = FrameProtocol.read_frame(self.server)
+        sender.join()
+        self.assertEqual(msg_type, FrameProtocol.MSG_AUDIO)
+        self.assertEqual(arg, 3)
+        self.assertEqual(bytes(data), payload)
+
+    def test_empty_payload(self):
+        """测试空负载帧"""
+        FrameProtocol.send_frame(self.client, FrameProtocol.MSG_STREAM_END)
+        msg_type, _, data = FrameProtocol.read_frame(self.server)
+        self.assertEqual(msg_type, FrameProtocol.MSG_STREAM_END)
+        self.assertEqual(len(data), 0)
+
+    def test_bad_magic(self):
+        """测试非法帧头"""
+        self.client.sendall(b'XX' + bytes(FrameProtocol.HEADER.size - 2))
+        with self.assertRaises(FrameProtocol.FrameError):
+            FrameProtocol.read_frame(self.server)
+
+    def test_closed_connection(self):
+        """测试连接中断"""
+        self.client.sendall(FrameProtocol.pack_header(FrameProtocol.MSG_AUDIO, 100) + b'abc')
+        self.client.close()
+        with self.assertRaises(ConnectionError):
+            FrameProtocol.read_frame(self.server)
+
+
+if __name__ == '__main__':
+    unittest.main()
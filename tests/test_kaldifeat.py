@@ -0,0 +1,143 @@
+import unittest
+
+import numpy as np
+
+from ASR.rapid_paraformer.kaldifeat import StreamingFbank, StreamingLfr
+from ASR.rapid_paraformer.kaldifeat.feature import (FbankPlan, compute_fbank_feats, compute_mel_banks,
+                                                    extract_window, extract_window_loop, mel_scale)
+
+
+def window_args(**kwargs):
+    args = dict(blackman_coeff=0.42, dither=0.0, window_size=400, window_shift=160,
+                preemphasis_coefficient=0.97, raw_energy=True, remove_dc_offset=True,
+                snip_edges=True, window_type='povey', dtype=np.float32)
+    args.update(kwargs)
+    return args
+
+
+class TestExtractWindow(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.waveform = (rng.standard_normal(16000 * 2) * 3000).astype(np.float32)
+
+    def assert_same(self, **kwargs):
+        frames, energy = extract_window(self.waveform, **window_args(**kwargs))
+        frames_ref, energy_ref = extract_window_loop(self.waveform, **window_args(**kwargs))
+        np.testing.assert_allclose(frames, frames_ref, rtol=1e-6, atol=1e-3)
+        np.testing.assert_allclose(energy, energy_ref, rtol=1e-6)
+        self.assertEqual(frames.dtype, frames_ref.dtype)
+
+    def test_window_types(self):
+        """测试各种窗函数与逐帧实现一致"""
+        for window_type in ['hanning', 'sine', 'hamming', 'povey', 'rectangular', 'blackman']:
+            with self.subTest(window_type=window_type):
+                self.assert_same(window_type=window_type)
+
+    def test_options(self):
+        """测试能量、去直流、预加重、边缘选项与逐帧实现一致"""
+        self.assert_same(raw_energy=False)
+        self.assert_same(remove_dc_offset=False, preemphasis_coefficient=0.0)
+        self.assert_same(snip_edges=False)
+        self.assert_same(dtype=np.float64)
+
+    def test_dither_seeded(self):
+        """测试固定随机种子时抖动结果一致"""
+        np.random.seed(1)
+        frames, energy = extract_window(self.waveform, **window_args(dither=1.0))
+        np.random.seed(1)
+        frames_ref, energy_ref = extract_window_loop(self.waveform, **window_args(dither=1.0))
+        np.testing.assert_allclose(frames, frames_ref, rtol=1e-6, atol=1e-3)
+        np.testing.assert_allclose(energy, energy_ref, rtol=1e-6)
+
+
+def compute_mel_banks_loop(num_bins, sample_frequency, low_freq, high_freq, n):
+    num_fft_bins = n // 2
+    if high_freq <= 0:
+        high_freq = 0.5 * sample_frequency + high_freq
+    fft_bin_width = sample_frequency / n
+    mel_low_freq = mel_scale(low_freq)
+    mel_freq_delta = (mel_scale(high_freq) - mel_low_freq) / (num_bins + 1)
+    mel_banks = np.zeros([num_bins, num_fft_bins + 1])
+    for i in range(num_bins):
+        left_mel = mel_low_freq + mel_freq_delta * i
+        center_mel = left_mel + mel_freq_delta
+        right_mel = center_mel + mel_freq_delta
+        for j in range(num_fft_bins):
+            mel = mel_scale(fft_bin_width * j)
+            if left_mel < mel < right_mel:
+                if mel <= center_mel:
+                    mel_banks[i, j] = (mel - left_mel) / (center_mel - left_mel)
+                else:
+                    mel_banks[i, j] = (right_mel - mel) / (right_mel - center_mel)
+    return mel_banks
+
+
+class TestFbankPlan(unittest.TestCase):
+    def test_mel_banks(self):
+        """测试矩阵化 Mel 滤波器组与逐点实现一致"""
+        for args in [(23, 16000, 20, 0, 512), (80, 16000, 20, 0, 512), (40, 8000, 64, -200, 256)]:
+            with self.subTest(args=args):
+                np.testing.assert_array_equal(compute_mel_banks(*args), compute_mel_banks_loop(*args))
+
+    def test_plan_shared(self):
+        """测试相同参数共享同一个 plan，且结果与不传 plan 一致"""
+        plan = FbankPlan.get(num_mel_bins=80, window_type='hamming')
+        self.assertIs(plan, FbankPlan.get(num_mel_bins=80, window_type='hamming'))
+        self.assertEqual((plan.window_size, plan.window_shift, plan.n), (400, 160, 512))
+        waveform = (np.random.default_rng(0).standard_normal(16000) * 3000).astype(np.float32)
+        feat = compute_fbank_feats(waveform, dither=0.0, plan=plan)
+        self.assertEqual(feat.shape, (98, 80))
+        np.testing.assert_array_equal(
+            feat, compute_fbank_feats(waveform, dither=0.0, num_mel_bins=80, window_type='hamming'))
+
+
+def chunks(array, sizes):
+    pos = 0
+    for size in sizes:
+        yield array[pos:pos + size]
+        pos += size
+    yield array[pos:]
+
+
+class TestStreaming(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.waveform = (rng.standard_normal(16000) * 3000).astype(np.float32)
+        self.sizes = [0, 1, 399, 160, 1000, 37, 4096, 3]
+
+    def test_fbank_matches_offline(self):
+        """测试分块输入的流式 fbank 与整句计算完全一致"""
+        plan = FbankPlan.get(num_mel_bins=80, window_type='hamming')
+        offline = compute_fbank_feats(self.waveform, dither=0.0, plan=plan)
+        stream = StreamingFbank(plan=plan)
+        online = np.concatenate([stream.accept_waveform(c) for c in chunks(self.waveform, self.sizes)])
+        # framing and windowing are bit-exact, BLAS may round the mel matmul of a few rows differently
+        np.testing.assert_allclose(online, offline, rtol=1e-6)
+        self.assertEqual(stream.num_frames, offline.shape[0])
+
+    def test_lfr_matches_offline(self):
+        """测试流式 LFR 与 apply_lfr 完全一致"""
+        from ASR.rapid_paraformer.utils import WavFrontend
+        rng = np.random.default_rng(1)
+        for T in [1, 6, 7, 50, 98]:
+            for lfr_m, lfr_n in [(7, 6), (5, 3), (2, 4)]:
+                with self.subTest(T=T, lfr_m=lfr_m, lfr_n=lfr_n):
+                    feats = rng.standard_normal((T, 8)).astype(np.float32)
+                    lfr = StreamingLfr(lfr_m, lfr_n)
+                    parts = [lfr.accept(c) for c in chunks(feats, [0, 1, 3, 5, 2])]
+                    online = np.concatenate(parts + [lfr.finalize()])
+                    np.testing.assert_array_equal(online, WavFrontend.apply_lfr(feats, lfr_m, lfr_n))
+
+    def test_frontend_stream(self):
+        """测试 WavFrontend 流式特征与离线 fbank + lfr_cmvn 一致"""
+        from ASR.rapid_paraformer.utils import WavFrontend
+        frontend = WavFrontend(cmvn_file='ASR/resources/models/am.mvn', n_mels=80, lfr_m=7, lfr_n=6, dither=0.0)
+        waveform = self.waveform / (1 << 15)
+        offline, _ = frontend.lfr_cmvn(frontend.fbank(waveform[None, :])[0])
+        stream = frontend.stream()
+        parts = [stream.accept_waveform(c) for c in chunks(waveform, self.sizes)]
+        np.testing.assert_allclose(np.concatenate(parts + [stream.finalize()]), offline, rtol=1e-5, atol=1e-5)
+
+
+if __name__ == '__main__':
+    unittest.main()
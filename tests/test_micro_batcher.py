@@ -0,0 +1,69 @@
+import threading
+import time
+import unittest
+
+from utils.MicroBatcher import MicroBatcher
+
+
+class TestMicroBatcher(unittest.TestCase):
+    def setUp(self):
+        self.batches = []
+
+    def batch_fn(self, items):
+        self.batches.append(list(items))
+        time.sleep(0.05)
+        return [item * 2 for item in items]
+
+    def run_concurrently(self, batcher, items):
+        results = {}
+
+        def call(item):
+            results[item] = batcher.submit(item)
+
+        threads = [threading.Thread(target=call, args=(item,)) for item in items]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_single_caller_not_delayed(self):
+        """测试单个调用不等待凑批"""
+        batcher = MicroBatcher(self.batch_fn, max_batch=3, window=1.0)
+        stime = time.time()
+        self.assertEqual(batcher.submit(1), 2)
+        self.assertLess(time.time() - stime, 0.5)
+
+    def test_concurrent_batched(self):
+        """测试并发调用被合并，结果按调用方分发"""
+        batcher = MicroBatcher(self.batch_fn, max_batch=3, window=0.05)
+        results = self.run_concurrently(batcher, range(6))
+        self.assertEqual(results, {i: i * 2 for i in range(6)})
+        self.assertLess(len(self.batches), 6)
+        self.assertTrue(all(len(batch) <= 3 for batch in self.batches))
+
+    def test_error_reaches_all_callers(self):
+        """测试批处理异常抛给该批的所有调用方"""
+        def broken(items):
+            time.sleep(0.05)
+            raise ValueError('model failed')
+
+        batcher = MicroBatcher(broken, max_batch=4, window=0.05)
+        errors = []
+
+        def call():
+            try:
+                batcher.submit(0)
+            except ValueError as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=call) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(errors), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import glob
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+import onnxruntime
+
+from utils import OnnxGraphCache
+
+
+def field(number, wire_type, payload):
+    key = varint(number << 3 | wire_type)
+    if wire_type == 0:
+        return key + varint(payload)
+    return key + varint(len(payload)) + payload
+
+
+def varint(value):
+    out = b''
+    while True:
+        byte = value & 0x7f
+        value >>= 7
+        if value:
+            out += bytes([byte | 0x80])
+        else:
+            return out + bytes([byte])
+
+
+def tensor_value_info(name):
+    dim = field(1, 2, field(1, 0, 2))
+    tensor_type = field(1, 0, 1) + field(2, 2, dim)
+    return field(1, 2, name.encode()) + field(2, 2, field(1, 2, tensor_type))
+
+
+def relu_model():
+    """float[2] x -> Relu -> y, encoded by hand since the onnx package is not a dependency"""
+    node = field(1, 2, b'x') + field(2, 2, b'y') + field(4, 2, b'Relu')
+    graph = field(1, 2, node) + field(2, 2, b'g') + field(11, 2, tensor_value_info('x')) \
+        + field(12, 2, tensor_value_info('y'))
+    return field(1, 0, 7) + field(7, 2, graph) + field(8, 2, field(2, 0, 13))
+
+
+class TestOnnxGraphCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.model_path = os.path.join(self.tmp_dir.name, 'model.onnx')
+        with open(self.model_path, 'wb') as f:
+            f.write(relu_model())
+        self.providers = ['CPUExecutionProvider']
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def run_model(self, session):
+        return session.run(None, {'x': np.array([-1.0, 2.0], dtype=np.float32)})[0]
+
+    def test_cache_written_then_used(self):
+        """测试首次加载写出优化图，之后直接加载缓存"""
+        optimized_path = OnnxGraphCache.cache_path(self.model_path, self.providers)
+        session = OnnxGraphCache.load_session(self.model_path, self.providers)
+        self.assertTrue(os.path.exists(optimized_path))
+        np.testing.assert_array_equal(self.run_model(session), [0.0, 2.0])
+
+        options = onnxruntime.SessionOptions()
+        session = OnnxGraphCache.load_session(self.model_path, self.providers, options)
+        np.testing.assert_array_equal(self.run_model(session), [0.0, 2.0])
+        # the caller's options are left as they were
+        self.assertEqual(options.graph_optimization_level, onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL)
+        self.assertEqual(options.optimized_model_filepath, '')
+
+    def test_key_changes_with_model(self):
+        """测试模型变化时重新生成缓存并清理旧文件"""
+        int8_path = os.path.join(self.tmp_dir.name, 'model.int8.0123456789abcdef.opt.onnx')
+        open(int8_path, 'wb').close()
+        OnnxGraphCache.load_session(self.model_path, self.providers)
+        old_path = OnnxGraphCache.cache_path(self.model_path, self.providers)
+        with open(self.model_path, 'ab') as f:
+            f.write(b'\x12\x04test')  # producer_name, changes the hash only
+        new_path = OnnxGraphCache.cache_path(self.model_path, self.providers)
+        self.assertNotEqual(old_path, new_path)
+        OnnxGraphCache.load_session(self.model_path, self.providers)
+        self.assertEqual(set(glob.glob(os.path.join(self.tmp_dir.name, '*.opt.onnx'))), {int8_path, new_path})
+
+    def test_corrupt_cache_rebuilt(self):
+        """测试缓存文件损坏时重新优化"""
+        optimized_path = OnnxGraphCache.cache_path(self.model_path, self.providers)
+        with open(optimized_path, 'wb') as f:
+            f.write(b'broken')
+        session = OnnxGraphCache.load_session(self.model_path, self.providers)
+        np.testing.assert_array_equal(self.run_model(session), [0.0, 2.0])
+        self.assertGreater(os.path.getsize(optimized_path), 6)
+
+    def test_model_hashed_once(self):
+        """测试多个会话加载同一模型时只计算一次哈希"""
+        with mock.patch.object(OnnxGraphCache, '_hash_file', wraps=OnnxGraphCache._hash_file) as hash_file:
+            for _ in range(3):
+                OnnxGraphCache.load_session(self.model_path, self.providers)
+        self.assertEqual(hash_file.call_count, 1)
+
+    def test_unwritable_cache(self):
+        """测试缓存目录不可写时不使用缓存直接加载"""
+        unwritable = os.path.join(self.tmp_dir.name, 'missing', 'model.opt.onnx')
+        options = onnxruntime.SessionOptions()
+        with mock.patch.object(OnnxGraphCache, 'cache_path', return_value=unwritable):
+            session = OnnxGraphCache.load_session(self.model_path, self.providers, options)
+        np.testing.assert_array_equal(self.run_model(session), [0.0, 2.0])
+        self.assertFalse(os.path.exists(os.path.dirname(unwritable)))
+        self.assertEqual(options.optimized_model_filepath, '')
+
+
+if __name__ == '__main__':
+    unittest.main()
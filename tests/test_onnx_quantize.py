@@ -0,0 +1,24 @@
+import os
+import tempfile
+import unittest
+
+from utils import OnnxQuantize
+
+
+class TestOnnxQuantize(unittest.TestCase):
+    def test_model_for_precision(self):
+        """测试按精度选择模型文件"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            model_path = os.path.join(tmp_dir, 'model.onnx')
+            self.assertEqual(OnnxQuantize.model_for_precision(model_path), model_path)
+            with self.assertRaises(FileNotFoundError):
+                OnnxQuantize.model_for_precision(model_path, 'int8')
+            open(os.path.join(tmp_dir, 'model.int8.onnx'), 'wb').close()
+            self.assertEqual(OnnxQuantize.model_for_precision(model_path, 'int8'),
+                             os.path.join(tmp_dir, 'model.int8.onnx'))
+            with self.assertRaises(ValueError):
+                OnnxQuantize.model_for_precision(model_path, 'fp16')
+
+
+if __name__ == '__main__':
+    unittest.main()
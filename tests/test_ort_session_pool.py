@@ -0,0 +1,88 @@
+import queue
+import threading
+import time
+import unittest
+
+from ASR.rapid_paraformer.utils import ONNXRuntimeError, OrtInferSession
+
+
+class FakeInput():
+    def __init__(self, name):
+        self.name = name
+
+
+class FakeSession():
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.running = 0
+
+    def get_inputs(self):
+        return [FakeInput('speech'), FakeInput('speech_lengths')]
+
+    def run(self, output_names, input_dict):
+        self.running += 1
+        if self.running > 1:
+            raise RuntimeError('session used concurrently')
+        time.sleep(self.delay)
+        self.running -= 1
+        if input_dict['speech'] is None:
+            raise RuntimeError('bad input')
+        return [input_dict['speech']]
+
+
+def make_pool(size):
+    # the ONNX model is not shipped with the repo, only the pool logic is real
+    pool = OrtInferSession.__new__(OrtInferSession)
+    pool.sessions = [FakeSession() for _ in range(size)]
+    pool.session = pool.sessions[0]
+    pool.idle = queue.Queue()
+    for session in pool.sessions:
+        pool.idle.put(session)
+    return pool
+
+
+class TestOrtSessionPool(unittest.TestCase):
+    def test_concurrent_calls_use_separate_sessions(self):
+        """测试并发调用各自借用一个会话"""
+        pool = make_pool(2)
+        results = []
+        threads = [threading.Thread(target=lambda i=i: results.append(pool([i, 1])[0])) for i in range(4)]
+        stime = time.time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(results), [0, 1, 2, 3])
+        # 4 calls on 2 sessions take two rounds
+        self.assertLess(time.time() - stime, 0.18)
+        self.assertEqual(pool.idle.qsize(), 2)
+
+    def test_checkout_timeout_and_return(self):
+        """测试借出超时，以及异常后会话归还"""
+        pool = make_pool(1)
+        with pool.checkout():
+            with self.assertRaises(queue.Empty):
+                with pool.checkout(timeout=0.01):
+                    pass
+        with self.assertRaises(ONNXRuntimeError):
+            pool([None, 1])
+        self.assertEqual(pool.idle.qsize(), 1)
+
+    def test_session_factory(self):
+        """测试由外部工厂创建池中的会话"""
+        config = {'model_path': 'missing.onnx', 'use_cuda': False,
+                  'session_pool': {'size': 2, 'intra_op_num_threads': 1}}
+        calls = []
+
+        def factory(model_conf, providers, sess_options):
+            calls.append((model_conf['model_path'], sess_options.intra_op_num_threads))
+            return FakeSession()
+
+        pool = OrtInferSession(config, session_factory=factory)
+        self.assertEqual(calls, [('missing.onnx', 1)] * 2)
+        self.assertEqual(pool.idle.qsize(), 2)
+        self.assertEqual(pool([3, 1]), [3])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,217 @@
+import io
+import os
+import pickle
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from ASR.rapid_paraformer import ASRResult, RapidParaformer
+from ASR.rapid_paraformer import utils
+from ASR.rapid_paraformer.utils import ONNXRuntimeError
+from ASR.rapid_paraformer.utils import CharTokenizer, TokenIDConverter, WavFrontend
+from utils import WavUtils
+
+CMVN_FILE = 'ASR/resources/models/am.mvn'
+
+
+def make_paraformer(batch_size):
+    # the ONNX model is not shipped with the repo, only the frontend is real
+    paraformer = RapidParaformer.__new__(RapidParaformer)
+    paraformer.frontend = WavFrontend(cmvn_file=CMVN_FILE, n_mels=80, lfr_m=7, lfr_n=6, dither=0.0)
+    paraformer.batch_size = batch_size
+    paraformer.max_segment_frames = 300
+    paraformer.segment_workers = 2
+    paraformer.feature_pool = None
+    paraformer.batches = []
+
+    def infer(feats, feats_len):
+        paraformer.batches.append(feats.shape)
+        return feats, feats_len
+
+    paraformer.infer = infer
+    paraformer.decode = lambda am_scores, feats_len: ([str(n) for n in feats_len], np.zeros(len(feats_len)))
+    return paraformer
+
+
+def decode_one(converter, tokenizer, am_score, valid_token_num):
+    yseq = am_score.argmax(axis=-1)
+    token_int = list(filter(lambda x: x not in (0, 2), yseq.tolist()))
+    text = tokenizer.tokens2text(converter.ids2tokens(token_int))
+    return text[:valid_token_num - 1]
+
+
+class TestRapidParaformer(unittest.TestCase):
+    def test_pad_feats(self):
+        """测试 padding 写入预分配的 float32 张量"""
+        feats = [np.ones((3, 4), dtype=np.float32), np.full((5, 4), 2, dtype=np.float32)]
+        batch = RapidParaformer.pad_feats(feats, 5)
+        self.assertEqual(batch.dtype, np.float32)
+        self.assertEqual(batch.shape, (2, 5, 4))
+        np.testing.assert_array_equal(batch[0, 3:], 0)
+        np.testing.assert_array_equal(batch[1], 2)
+
+    def test_sort_by_length(self):
+        """测试按长度分桶推理，结果保持输入顺序"""
+        rng = np.random.default_rng(0)
+        lengths = [48000, 8000, 40000, 9600, 44000, 12000]
+        wavs = [rng.standard_normal(n).astype(np.float32) * 0.1 for n in lengths]
+
+        unsorted = make_paraformer(batch_size=2)
+        expected = unsorted(wavs)
+        paraformer = make_paraformer(batch_size=2)
+        self.assertEqual(paraformer(wavs, sort_by_length=True), expected)
+        padded = sum(b * t for b, t, _ in paraformer.batches)
+        self.assertLess(padded, sum(b * t for b, t, _ in unsorted.batches))
+
+
+    def test_feature_pool(self):
+        """测试线程池并行提取特征与串行结果一致"""
+        paraformer = make_paraformer(batch_size=4)
+        rng = np.random.default_rng(0)
+        wavs = [rng.standard_normal((1, n)).astype(np.float32) * 0.1 for n in (16000, 8000, 24000, 4000)]
+        expected = paraformer.extract_feat(wavs)
+        with ThreadPoolExecutor(3) as pool:
+            paraformer.feature_pool = pool
+            result = paraformer.extract_feat(wavs)
+        for a, b in zip(result, expected):
+            np.testing.assert_array_equal(a, b)
+
+    def test_decode(self):
+        """测试批量贪心解码与逐条解码一致，并返回得分"""
+        token_list = ['<blank>', '<s>', '</s>', '<space>', 'ab'] + [chr(0x4e00 + i) for i in range(20)]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            token_path = os.path.join(tmp_dir, 'tokens.pkl')
+            with open(token_path, 'wb') as f:
+                pickle.dump(token_list, f)
+            converter = TokenIDConverter(token_path)
+        tokenizer = CharTokenizer()
+        paraformer = RapidParaformer.__new__(RapidParaformer)
+        paraformer.token_table = RapidParaformer.build_token_table(converter, tokenizer)
+
+        rng = np.random.default_rng(0)
+        logits = rng.standard_normal((3, 12, len(token_list)))
+        am_scores = logits - np.log(np.exp(logits).sum(axis=-1, keepdims=True))
+        token_nums = np.array([12, 7, 1], dtype=np.int32)
+        texts, scores = paraformer.decode(am_scores, token_nums)
+        self.assertEqual(texts, [decode_one(converter, tokenizer, a, n) for a, n in zip(am_scores, token_nums)])
+        for score, am_score, n in zip(scores, am_scores, token_nums):
+            self.assertAlmostEqual(score, am_score[:n].max(axis=-1).sum())
+
+
+    def test_load_pcm(self):
+        """测试 PCM 输入：int16/float32/bytes，16k 不重采样，48k 重采样"""
+        paraformer = make_paraformer(batch_size=1)
+        wav = (np.sin(np.arange(48000) * 0.05) * 8000).astype(np.int16)
+
+        waveform, = paraformer.load_data(wav, fs=48000)
+        self.assertEqual(waveform.shape, (1, 16000))
+        self.assertEqual(waveform.dtype, np.float32)
+
+        float_wav = wav.astype(np.float32) / (1 << 15)
+        waveform, = paraformer.load_data(float_wav)
+        self.assertTrue(np.shares_memory(waveform, float_wav))
+        np.testing.assert_array_equal(paraformer.load_data(wav.tobytes())[0], waveform)
+
+        stereo = np.stack([float_wav, float_wav])
+        np.testing.assert_array_equal(paraformer.load_data(stereo)[0], waveform)
+
+    def test_resample(self):
+        """测试 soxr 与多相滤波两种重采样结果接近"""
+        t = np.arange(44100) / 44100
+        wav = np.sin(2 * np.pi * 440 * t).astype(np.float32)
+        expected = np.sin(2 * np.pi * 440 * np.arange(16000) / 16000)
+        self.assertEqual(utils.resample_ratio(44100, 16000), (160, 441))
+        soxr_module = utils.soxr
+        try:
+            for backend in (soxr_module, None):
+                utils.soxr = backend
+                resampled = utils.resample(wav, 44100, 16000)
+                self.assertEqual(resampled.shape, (16000,))
+                np.testing.assert_allclose(resampled[200:-200], expected[200:-200], atol=1e-2)
+        finally:
+            utils.soxr = soxr_module
+
+    def test_read_wav(self):
+        """测试用 soundfile 读取 wav 文件"""
+        paraformer = make_paraformer(batch_size=1)
+        wav = (np.random.default_rng(0).standard_normal(8000) * 3000).astype(np.int16)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'test.wav')
+            utils.soundfile.write(path, wav, 8000, subtype='PCM_16')
+            waveform, = paraformer.load_data(path)
+        self.assertEqual(waveform.shape, (1, 16000))
+
+
+    def test_transcribe_long(self):
+        """测试长音频分段推理后按顺序拼接"""
+        paraformer = make_paraformer(batch_size=2)
+        rng = np.random.default_rng(0)
+        speech = [np.sin(np.arange(n) * 0.3).astype(np.float32) * 0.3 for n in (32000, 16000, 40000)]
+        silence = rng.standard_normal(4000).astype(np.float32) * 1e-4
+        waveform = np.concatenate([speech[0], silence, speech[1], silence, speech[2]])
+        self.assertTrue(paraformer.is_long(waveform[None, :]))
+
+        result = paraformer.transcribe_long(waveform)
+        # the fake decoder returns each segment's LFR length, so the text spells out the segments in order
+        self.assertEqual(len(paraformer.batches), 2)
+        self.assertTrue(all(t <= 300 // 6 + 1 for _, t, _ in paraformer.batches))
+        self.assertTrue(result.text.startswith('34'), result.text)
+        self.assertAlmostEqual(result.duration, len(waveform) / 16000)
+        self.assertTrue(0.9 < result.voiced_ratio <= 1.0, result.voiced_ratio)
+
+    def test_detailed_result(self):
+        """测试详细结果：文本、平均得分、时长与有声比例"""
+        paraformer = make_paraformer(batch_size=2)
+        paraformer.decode = lambda am_scores, token_nums: ([str(n) for n in token_nums], -0.5 * token_nums)
+        speech = np.sin(np.arange(16000) * 0.3).astype(np.float32) * 0.3
+        silence = np.zeros(16000, dtype=np.float32)
+        results = paraformer([speech, np.concatenate([speech, silence])], detailed=True)
+        self.assertTrue(all(isinstance(r, ASRResult) for r in results))
+        self.assertEqual([r.text for r in results], paraformer([speech, np.concatenate([speech, silence])]))
+        self.assertEqual([r.duration for r in results], [1.0, 2.0])
+        self.assertAlmostEqual(results[0].score, -0.5)
+        self.assertAlmostEqual(results[0].confidence, np.exp(-0.5))
+        self.assertGreater(results[0].voiced_ratio, 0.9)
+        self.assertTrue(0.4 < results[1].voiced_ratio < 0.6, results[1].voiced_ratio)
+
+    def test_too_short(self):
+        """测试空音频与不足一帧的音频直接返回空结果"""
+        paraformer = make_paraformer(batch_size=2)
+        buf = io.BytesIO()
+        utils.soundfile.write(buf, np.zeros(100, dtype=np.int16), 16000, subtype='PCM_16', format='WAV')
+        samples, sr = WavUtils.parse_wav(buf.getvalue())
+        speech = np.sin(np.arange(16000) * 0.3).astype(np.float32) * 0.3
+
+        results = paraformer([b'', samples, speech], fs=sr, detailed=True)
+        self.assertEqual([r.text for r in results[:2]], ['', ''])
+        self.assertEqual(results[0].score, float('-inf'))
+        self.assertEqual(results[0].duration, 0.0)
+        self.assertAlmostEqual(results[1].duration, 100 / 16000)
+        self.assertTrue(results[2].text)
+        # the short ones never reach the model
+        self.assertEqual([b for b, _, _ in paraformer.batches], [1])
+
+    def test_rejected_batch(self):
+        """测试整批推理失败时逐条重试，静音条目返回空文本"""
+        paraformer = make_paraformer(batch_size=3)
+        fake_infer = paraformer.infer
+
+        def infer(feats, feats_len):
+            # the model rejects any batch holding the short utterance
+            if feats_len.min() < 10:
+                raise ONNXRuntimeError('silence')
+            return fake_infer(feats, feats_len)
+
+        paraformer.infer = infer
+        rng = np.random.default_rng(0)
+        wavs = [rng.standard_normal(n).astype(np.float32) * 0.1 for n in (16000, 800, 24000)]
+        results = paraformer(wavs, detailed=True)
+        self.assertEqual([bool(r.text) for r in results], [True, False, True])
+        self.assertEqual(results[1].score, float('-inf'))
+        self.assertEqual(results[1].confidence, 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
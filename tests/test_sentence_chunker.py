@@ -0,0 +1,42 @@
+import unittest
+
+from GPT.SentenceChunker import SentenceChunker
+
+
+def chunk(deltas, **kwargs):
+    chunker = SentenceChunker(**kwargs)
+    sentences = []
+    for delta in deltas:
+        sentences.extend(chunker.feed(delta))
+    return sentences + chunker.flush()
+
+
+class TestSentenceChunker(unittest.TestCase):
+    def test_chinese_sentences(self):
+        """测试按中文标点切句"""
+        deltas = ['你好呀', '，旅行者！今天', '天气真好。我们', '去哪里玩？', '走吧']
+        self.assertEqual(chunk(deltas), ['你好呀，旅行者！', '今天天气真好。', '我们去哪里玩？', '走吧'])
+
+    def test_min_len_merges_short(self):
+        """测试过短的句子与下一句合并"""
+        self.assertEqual(chunk(['嗯。', '好的，我知道了。'], min_len=4), ['嗯。好的，我知道了。'])
+
+    def test_closing_quote_stays(self):
+        """测试句末引号归属当前句"""
+        self.assertEqual(chunk(['她说「走吧！', '」然后就走了。']), ['她说「走吧！」', '然后就走了。'])
+
+    def test_western_punctuation(self):
+        """测试英文标点，小数点不切分"""
+        deltas = ['Pi is 3.', '14 roughly. Is it', '? Yes!']
+        self.assertEqual(chunk(deltas), ['Pi is 3.14 roughly.', 'Is it?', 'Yes!'])
+
+    def test_max_len(self):
+        """测试超长无标点文本在逗号或最大长度处切分"""
+        sentences = chunk(['一二三四五六七八，九十一二三四五六七八九十一二三'], min_len=2, max_len=12)
+        self.assertEqual(sentences[0], '一二三四五六七八，')
+        self.assertTrue(all(len(s) <= 12 for s in sentences))
+        self.assertEqual(''.join(sentences), '一二三四五六七八，九十一二三四五六七八九十一二三')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.CancelToken import CancelToken
+from utils.SentencePipeline import SentencePipeline
+
+
+def slow_stream(sentences, delay):
+    for sentence in sentences:
+        time.sleep(delay)
+        yield sentence
+
+
+class TestSentencePipeline(unittest.TestCase):
+    def setUp(self):
+        self.pool = ThreadPoolExecutor(2)
+        self.sent = []
+
+    def tearDown(self):
+        self.pool.shutdown()
+
+    def synthesize(self, text):
+        time.sleep(0.05)
+        return text.encode()
+
+    def send(self, audio, senti):
+        time.sleep(0.05)
+        self.sent.append((audio, senti))
+
+    def test_order_and_overlap(self):
+        """测试输出顺序以及各阶段并行"""
+        sentences = ['句子%i' % i for i in range(6)]
+        pipeline = SentencePipeline(self.synthesize, len, self.send, self.pool)
+        stime = time.time()
+        pipeline.run(slow_stream(sentences, 0.05))
+        elapsed = time.time() - stime
+        self.assertEqual(self.sent, [(s.encode(), len(s)) for s in sentences])
+        # serial execution would take 6 * 0.15s
+        self.assertLess(elapsed, 0.6)
+
+    def test_error_propagates(self):
+        """测试 LLM 异常会抛给调用方"""
+        def broken():
+            yield '第一句'
+            raise ValueError('stream broke')
+
+        pipeline = SentencePipeline(self.synthesize, len, self.send, self.pool)
+        with self.assertRaises(ValueError):
+            pipeline.run(broken())
+        self.assertEqual(len(self.sent), 1)
+
+    def test_send_error_stops_pipeline(self):
+        """测试发送失败时停止上游"""
+        def send(audio, senti):
+            raise ConnectionError('client gone')
+
+        pipeline = SentencePipeline(self.synthesize, len, send, self.pool)
+        with self.assertRaises(ConnectionError):
+            pipeline.run(iter(['一', '二', '三', '四', '五']))
+
+    def test_cancel(self):
+        """测试打断后丢弃排队中的音频"""
+        token = CancelToken()
+
+        def send(audio, senti):
+            self.sent.append(audio)
+            if len(self.sent) == 2:
+                token.cancel()
+
+        pipeline = SentencePipeline(self.synthesize, len, send, self.pool)
+        stime = time.time()
+        pipeline.run(slow_stream(['句子%i' % i for i in range(20)], 0.01), token)
+        self.assertEqual(len(self.sent), 2)
+        self.assertLess(time.time() - stime, 0.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import argparse
+import socket
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import SocketServer
+from utils import FrameProtocol
+from utils.CancelToken import CancelToken
+
+
+class StubTTS():
+    """Same interface as TTS.TTService.TTService, without the VITS model."""
+
+    def read(self, text):
+        raise NotImplementedError
+
+    def read_save(self, text, filename, sr):
+        raise NotImplementedError
+
+    def read_bytes(self, text):
+        return ('RIFF' + text).encode()
+
+
+class StubGPT():
+    def ask(self, text, character=None):
+        return '你好。'
+
+    def ask_stream_sentences(self, text, character=None, cancel_token=None):
+        for sentence in ('你好。', '今天天气真好。'):
+            yield SimpleNamespace(text=sentence)
+
+
+def make_server(tts):
+    return SimpleNamespace(char_name={'paimon': [None, None, 'character_paimon', 1]},
+                           tts_lock=threading.Lock(),
+                           get_tts=lambda character: tts,
+                           sentiment=SimpleNamespace(infer=len),
+                           sentiment_pool=ThreadPoolExecutor(1),
+                           chat_gpt=StubGPT(),
+                           llm_service=None)
+
+
+def read_frames(conn):
+    frames = []
+    while True:
+        msg_type, arg, payload = FrameProtocol.read_frame(conn)
+        frames.append((msg_type, arg, bytes(payload)))
+        if msg_type == FrameProtocol.MSG_STREAM_END:
+            return frames
+
+
+class TestSocketSession(unittest.TestCase):
+    def setUp(self):
+        self.server_conn, self.client = socket.socketpair()
+        self.server = make_server(StubTTS())
+
+    def tearDown(self):
+        self.server.sentiment_pool.shutdown()
+        self.server_conn.close()
+        self.client.close()
+
+    def make_session(self, stream):
+        SocketServer.args = argparse.Namespace(protocol='framed', stream=stream, ack=False, ackTimeout=1.0,
+                                               character='paimon')
+        return SocketServer.Session(self.server, self.server_conn, None)
+
+    def test_reply_audio(self):
+        """测试回复经 TTS 合成后按帧发送，最后发送流结束"""
+        for stream, sentences in ((True, ['你好。', '今天天气真好。']), (False, ['你好。'])):
+            with self.subTest(stream=stream):
+                self.make_session(stream).reply('你好', CancelToken())
+                expected = [(FrameProtocol.MSG_AUDIO, len(s), ('RIFF' + s).encode()) for s in sentences]
+                self.assertEqual(read_frames(self.client), expected + [(FrameProtocol.MSG_STREAM_END, 0, b'')])
+
+    def test_failed_reply_ends_stream(self):
+        """测试 TTS 失败（包括文件错误）时仍发送流结束"""
+        def read_bytes(text):
+            raise FileNotFoundError('tmp/ does not exist')
+
+        self.server.get_tts = lambda character: SimpleNamespace(read_bytes=read_bytes)
+        self.make_session(stream=True).run_reply('你好', CancelToken())
+        self.assertEqual(read_frames(self.client), [(FrameProtocol.MSG_STREAM_END, 0, b'')])
+
+    def test_idle_cancel_answered(self):
+        """测试空闲时收到取消帧也回复流结束"""
+        session = self.make_session(stream=True)
+        FrameProtocol.send_frame(self.client, FrameProtocol.MSG_CANCEL)
+        FrameProtocol.send_frame(self.client, FrameProtocol.MSG_AUDIO, b'wav')
+        self.assertEqual(bytes(session._Session__receive_frame()), b'wav')
+        self.assertEqual(read_frames(self.client), [(FrameProtocol.MSG_STREAM_END, 0, b'')])
+
+    def test_disconnect_not_an_error(self):
+        """测试客户端正常断开时不记录错误"""
+        session = self.make_session(stream=True)
+        self.client.shutdown(socket.SHUT_WR)
+        with self.assertNoLogs(level='ERROR'):
+            session.serve()
+        msg_type, _, payload = FrameProtocol.read_frame(self.client)
+        self.assertEqual((msg_type, bytes(payload)), (FrameProtocol.MSG_HELLO, b'character_paimon'))
+
+
+if __name__ == '__main__':
+    unittest.main()
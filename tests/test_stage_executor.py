@@ -0,0 +1,69 @@
+import asyncio
+import threading
+import time
+import unittest
+
+from utils.StageExecutor import StageExecutor
+
+
+class TestStageExecutor(unittest.TestCase):
+    def test_loop_stays_responsive(self):
+        """测试阻塞调用不会阻塞事件循环"""
+        async def main():
+            stages = StageExecutor({'tts': 2})
+            ticks = 0
+
+            async def ticker():
+                nonlocal ticks
+                while True:
+                    await asyncio.sleep(0.01)
+                    ticks += 1
+
+            tick_task = asyncio.create_task(ticker())
+            stime = time.time()
+            await asyncio.gather(stages.run('tts', time.sleep, 0.2), stages.run('tts', time.sleep, 0.2))
+            elapsed = time.time() - stime
+            tick_task.cancel()
+            stages.shutdown()
+            return ticks, elapsed
+
+        ticks, elapsed = asyncio.run(main())
+        self.assertGreater(ticks, 5)
+        self.assertLess(elapsed, 0.35)
+
+    def test_bounded_queue(self):
+        """测试每个阶段的并发上限"""
+        async def main():
+            stages = StageExecutor({'asr': 1}, queue_size=1)
+            running = 0
+            peak = 0
+            lock = threading.Lock()
+
+            def work():
+                nonlocal running, peak
+                with lock:
+                    running += 1
+                    peak = max(peak, running)
+                time.sleep(0.02)
+                with lock:
+                    running -= 1
+
+            await asyncio.gather(*[stages.run('asr', work) for _ in range(5)])
+            stages.shutdown()
+            return peak
+
+        self.assertEqual(asyncio.run(main()), 1)
+
+    def test_iterate(self):
+        """测试在线程池中迭代阻塞生成器"""
+        async def main():
+            stages = StageExecutor()
+            items = [item async for item in stages.iterate('llm', (i * i for i in range(4)))]
+            stages.shutdown()
+            return items
+
+        self.assertEqual(asyncio.run(main()), [0, 1, 4, 9])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import unittest
+
+import numpy as np
+
+from ASR.rapid_paraformer.kaldifeat import compute_fbank_feats
+from ASR.rapid_paraformer.utils import WavFrontend
+
+CMVN_FILE = 'ASR/resources/models/am.mvn'
+
+
+def apply_lfr_loop(inputs, lfr_m, lfr_n):
+    LFR_inputs = []
+    T = inputs.shape[0]
+    T_lfr = int(np.ceil(T / lfr_n))
+    left_padding = np.tile(inputs[0], ((lfr_m - 1) // 2, 1))
+    inputs = np.vstack((left_padding, inputs))
+    T = T + (lfr_m - 1) // 2
+    for i in range(T_lfr):
+        if lfr_m <= T - i * lfr_n:
+            LFR_inputs.append((inputs[i * lfr_n:i * lfr_n + lfr_m]).reshape(1, -1))
+        else:
+            num_padding = lfr_m - (T - i * lfr_n)
+            frame = inputs[i * lfr_n:].reshape(-1)
+            for _ in range(num_padding):
+                frame = np.hstack((frame, inputs[-1]))
+            LFR_inputs.append(frame)
+    return np.vstack(LFR_inputs).astype(np.float32)
+
+
+class TestWavFrontend(unittest.TestCase):
+    def setUp(self):
+        self.rng = np.random.default_rng(0)
+
+    def test_lfr(self):
+        """测试 stride 实现的 LFR 与逐帧拼接一致"""
+        for T in [1, 5, 6, 7, 12, 97, 100]:
+            for lfr_m, lfr_n in [(7, 6), (5, 3), (1, 2)]:
+                with self.subTest(T=T, lfr_m=lfr_m, lfr_n=lfr_n):
+                    feat = self.rng.standard_normal((T, 80)).astype(np.float32)
+                    np.testing.assert_array_equal(
+                        WavFrontend.apply_lfr(feat, lfr_m, lfr_n), apply_lfr_loop(feat, lfr_m, lfr_n))
+
+    def test_lfr_cmvn(self):
+        """测试 LFR+CMVN 输出为连续 float32，且与 tile 实现一致"""
+        frontend = WavFrontend(cmvn_file=CMVN_FILE, n_mels=80, lfr_m=7, lfr_n=6, dither=0.0)
+        feat = self.rng.standard_normal((100, 80)).astype(np.float32)
+        out, out_len = frontend.lfr_cmvn(feat)
+        self.assertEqual(out.dtype, np.float32)
+        self.assertTrue(out.flags.c_contiguous)
+        self.assertEqual(out_len, 17)
+
+        lfr = apply_lfr_loop(feat, 7, 6)
+        means = np.tile(frontend.cmvn[0:1, :560], (lfr.shape[0], 1))
+        vars = np.tile(frontend.cmvn[1:2, :560], (lfr.shape[0], 1))
+        np.testing.assert_allclose(out, (lfr + means) * vars, rtol=1e-5, atol=1e-5)
+
+
+    def test_vad_trim(self):
+        """测试 VAD 去除首尾静音并保留 padding"""
+        frontend = WavFrontend(cmvn_file=CMVN_FILE, n_mels=80, lfr_m=7, lfr_n=6, dither=0.0,
+                               vad=True, vad_padding=10)
+        silence = self.rng.standard_normal(16000).astype(np.float32) * 1e-4
+        speech = np.sin(np.arange(16000) * 0.3).astype(np.float32) * 0.3
+        waveform = np.concatenate([silence, speech, silence])[None, :]
+
+        full, full_len = frontend.fbank(waveform)
+        feat, feat_len, removed, voiced = frontend.fbank_vad(waveform)
+        self.assertEqual(full_len, feat_len + removed)
+        self.assertTrue(90 <= voiced <= 105, voiced)
+        # about 100 voiced frames plus 10 frames padding each side
+        self.assertTrue(110 <= feat_len <= 125, feat_len)
+        _, log_energy = compute_fbank_feats(waveform[0] * (1 << 15), dither=0.0, use_energy=True,
+                                            plan=frontend.fbank_plan)
+        start, end = frontend.vad_bounds(log_energy)
+        self.assertEqual(end - start, feat_len)
+        np.testing.assert_array_equal(feat, full[start:end])
+
+    def test_vad_all_silence(self):
+        """测试全静音时不裁剪"""
+        frontend = WavFrontend(cmvn_file=CMVN_FILE, n_mels=80, vad=True, dither=0.0)
+        self.assertEqual(frontend.vad_bounds(np.full(50, 3.0)), (0, 50))
+        frontend.vad = False
+        waveform = self.rng.standard_normal((1, 8000)).astype(np.float32)
+        self.assertEqual(frontend.fbank_vad(waveform)[2], 0)
+
+
+    def test_split_segments(self):
+        """测试长音频在静音处切分，段长有上限，纯静音段被丢弃"""
+        frontend = WavFrontend(cmvn_file=CMVN_FILE, n_mels=80, dither=0.0)
+        log_energy = np.full(1000, 22.0)
+        log_energy[300:340] = 10.0
+        log_energy[600:900] = 10.0
+        log_energy[320] = 9.0
+        segments = frontend.split_segments(log_energy, max_frames=400)
+        self.assertEqual(segments[0], (0, 320))
+        self.assertTrue(all(e - b <= 400 for b, e in segments))
+        self.assertEqual(segments[-1][1], 1000)
+        self.assertEqual(frontend.split_segments(np.full(1000, 22.0), max_frames=400),
+                         [(0, 200), (200, 400), (400, 600), (600, 1000)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import io
+import struct
+import unittest
+
+import numpy as np
+import soundfile
+
+from utils import WavUtils
+
+
+def make_wav(samples, sr, subtype='PCM_16'):
+    buf = io.BytesIO()
+    soundfile.write(buf, samples, sr, subtype=subtype, format='WAV')
+    return buf.getvalue()
+
+
+class TestWavUtils(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.stereo = (rng.uniform(-0.5, 0.5, size=(4800, 2))).astype(np.float32)
+
+    def test_pcm16_stereo(self):
+        """测试 16 位立体声解码"""
+        data = make_wav(self.stereo, 48000)
+        samples, sr = WavUtils.parse_wav(data)
+        expected, _ = soundfile.read(io.BytesIO(data), dtype='float32')
+        self.assertEqual(sr, 48000)
+        self.assertEqual(samples.shape, (2, 4800))
+        np.testing.assert_array_equal(samples, expected.T)
+
+    def test_float_and_24bit(self):
+        """测试浮点和 24 位格式"""
+        for subtype in ('FLOAT', 'PCM_24', 'PCM_32'):
+            data = make_wav(self.stereo, 16000, subtype)
+            samples, _ = WavUtils.parse_wav(data)
+            expected, _ = soundfile.read(io.BytesIO(data), dtype='float32')
+            np.testing.assert_allclose(samples, expected.T, atol=1e-6)
+
+    def test_broken_size_fields(self):
+        """测试客户端未填写长度字段的 WAV"""
+        data = bytearray(make_wav(self.stereo, 44100))
+        data[4:8] = struct.pack('<I', 0)
+        data[40:44] = struct.pack('<I', 0)
+        samples, _ = WavUtils.parse_wav(data)
+        self.assertEqual(samples.shape, (2, 4800))
+
+        # truncated upload with a size larger than what arrived, odd trailing byte dropped
+        data = make_wav(self.stereo, 44100)[:-3]
+        samples, _ = WavUtils.parse_wav(data)
+        self.assertEqual(samples.shape, (2, 4799))
+
+    def test_bad_fmt_chunk(self):
+        """测试 fmt 块损坏：长度不足、被截断、声道数或块对齐为 0"""
+        data = make_wav(self.stereo, 16000)
+        fmt_size = bytearray(data)
+        fmt_size[16:20] = struct.pack('<I', 8)
+        no_channels = bytearray(data)
+        no_channels[22:24] = struct.pack('<H', 0)
+        no_block_align = bytearray(data)
+        no_block_align[32:34] = struct.pack('<H', 0)
+        for name, broken in (('fmt size', fmt_size), ('truncated', data[:28]),
+                             ('channels', no_channels), ('block align', no_block_align)):
+            with self.subTest(name):
+                with self.assertRaises(WavUtils.WavFormatError):
+                    WavUtils.parse_wav(broken)
+
+    def test_not_wav(self):
+        """测试非 WAV 数据"""
+        with self.assertRaises(WavUtils.WavFormatError):
+            WavUtils.parse_wav(b'hello world, this is not a wav file')
+
+
+if __name__ == '__main__':
+    unittest.main()
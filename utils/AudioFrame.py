@@ -0,0 +1,61 @@
+"""Binary WebSocket audio frames.
+
+Audio travels in binary WebSocket messages made of a fixed 12 byte header and
+the raw audio bytes; control messages and metadata stay in text JSON frames::
+
+    magic(4s) = b'DLAU' | version(B) | codec(B) | channels(B) | sentiment(b) | sample_rate(I)    little endian
+
+``sentiment`` is -1 on uploads. For ``CODEC_WAV`` the format comes from the WAV
+header and ``channels``/``sample_rate`` may be 0.
+"""
+import struct
+
+import numpy as np
+
+from utils import WavUtils
+
+MAGIC = b'DLAU'
+VERSION = 1
+HEADER = struct.Struct('<4sBBBbI')
+
+CODEC_WAV = 0
+CODEC_PCM16 = 1
+CODEC_FLOAT32 = 2
+
+
+class AudioFrameError(Exception):
+    pass
+
+
+def encode(payload, codec=CODEC_WAV, sample_rate=0, channels=0, sentiment=-1):
+    return HEADER.pack(MAGIC, VERSION, codec, channels, sentiment, sample_rate) + payload
+
+
+def decode(message):
+    """Decode a binary frame into ``(samples, sample_rate, sentiment)``.
+
+    Raw PCM payloads are viewed with ``np.frombuffer`` without copying; ``samples``
+    has shape (channels, n) for interleaved multi-channel audio.
+    """
+    if len(message) < HEADER.size:
+        raise AudioFrameError('Audio frame shorter than its header.')
+    magic, version, codec, channels, sentiment, sample_rate = HEADER.unpack_from(message)
+    if magic != MAGIC:
+        raise AudioFrameError('Bad audio frame magic %r.' % magic)
+    if version != VERSION:
+        raise AudioFrameError('Unsupported audio frame version %i.' % version)
+
+    if codec == CODEC_WAV:
+        samples, sample_rate = WavUtils.parse_wav(memoryview(message)[HEADER.size:])
+        return samples, sample_rate, sentiment
+    if codec == CODEC_PCM16:
+        samples = np.frombuffer(message, dtype='<i2', offset=HEADER.size)
+    elif codec == CODEC_FLOAT32:
+        samples = np.frombuffer(message, dtype='<f4', offset=HEADER.size)
+    else:
+        raise AudioFrameError('Unknown audio codec %i.' % codec)
+    if not sample_rate:
+        raise AudioFrameError('Raw PCM frame without a sample rate.')
+    channels = max(channels, 1)
+    samples = samples[:len(samples) - len(samples) % channels]
+    return samples.reshape(-1, channels).T, sample_rate, sentiment
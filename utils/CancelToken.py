@@ -0,0 +1,20 @@
+import threading
+
+
+class CancelToken():
+    """Cooperative cancellation flag shared by the stages of one reply.
+
+    The LLM stream, the TTS queue and the sender check it between units of work
+    (a token, a sentence), so a barge-in frees the pipeline at the next sentence
+    boundary at the latest.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
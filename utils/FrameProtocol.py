@@ -0,0 +1,68 @@
+"""Length-prefixed binary framing for the SocketServer.
+
+Every message is a fixed 10 byte header followed by ``length`` bytes of payload::
+
+    magic(2s) = b'DL' | version(B) | type(B) | arg(H) | length(I)    little endian
+
+The payload is read with ``recv_into`` straight into a preallocated buffer, so an
+upload costs a handful of ``recv`` calls and no per-chunk acks. Because every
+reply carries its own length and sentiment, the server sends each sentence as
+soon as it is synthesized instead of pausing so the client can tell them apart.
+"""
+import struct
+
+MAGIC = b'DL'
+PROTOCOL_VERSION = 1
+HEADER = struct.Struct('<2sBBHI')
+MAX_PAYLOAD = 64 * 1024 * 1024
+
+# message types
+MSG_HELLO = 0x01  # server -> client: character id; client -> server: character to use
+MSG_AUDIO = 0x02  # client -> server: WAV upload; server -> client: WAV reply, arg = sentiment
+MSG_STREAM_END = 0x03  # server -> client: reply finished
+MSG_ACK = 0x04  # client -> server: audio reply received (only when the server runs with --ack)
+MSG_CANCEL = 0x05  # client -> server: stop the current reply (barge-in), answered with MSG_STREAM_END
+
+
+class FrameError(Exception):
+    pass
+
+
+def recv_exact(conn, size):
+    buf = bytearray(size)
+    view = memoryview(buf)
+    received = 0
+    while received < size:
+        n = conn.recv_into(view[received:], size - received)
+        if n == 0:
+            raise ConnectionError('Connection closed after %i of %i bytes.' % (received, size))
+        received += n
+    return buf
+
+
+def pack_header(msg_type, length, arg=0):
+    return HEADER.pack(MAGIC, PROTOCOL_VERSION, msg_type, arg, length)
+
+
+def unpack_header(header):
+    magic, version, msg_type, arg, length = HEADER.unpack(header)
+    if magic != MAGIC:
+        raise FrameError('Bad frame magic %r.' % bytes(magic))
+    if version != PROTOCOL_VERSION:
+        raise FrameError('Unsupported protocol version %i.' % version)
+    if length > MAX_PAYLOAD:
+        raise FrameError('Frame payload too large: %i bytes.' % length)
+    return msg_type, arg, length
+
+
+def read_frame(conn):
+    """Read one frame and return ``(msg_type, arg, payload)``."""
+    msg_type, arg, length = unpack_header(recv_exact(conn, HEADER.size))
+    payload = recv_exact(conn, length) if length else bytearray()
+    return msg_type, arg, payload
+
+
+def send_frame(conn, msg_type, payload=b'', arg=0):
+    conn.sendall(pack_header(msg_type, len(payload), arg))
+    if payload:
+        conn.sendall(payload)
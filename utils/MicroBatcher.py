@@ -0,0 +1,70 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class MicroBatcher():
+    """Collects calls from concurrent threads into batches for one worker thread.
+
+    ``submit(item)`` blocks the caller until ``batch_fn`` has processed the batch
+    containing ``item`` and returns that item's result. ``batch_fn`` takes a list
+    of items and must return a list of results in the same order.
+
+    The worker only waits ``window`` seconds for more items while there is
+    contention, i.e. the previous batch had several items or more callers were
+    already queued. A lone caller is served immediately, so single-user latency
+    stays the same as calling ``batch_fn([item])`` directly.
+    """
+
+    def __init__(self, batch_fn, max_batch=3, window=0.02, name='batcher'):
+        self.batch_fn = batch_fn
+        self.max_batch = max(1, max_batch)
+        self.window = window
+        self.requests = queue.Queue()
+        self.last_batch_size = 0
+        self.worker = threading.Thread(target=self.__run, name=name, daemon=True)
+        self.worker.start()
+
+    def submit(self, item):
+        future = Future()
+        self.requests.put((item, future))
+        return future.result()
+
+    def __collect(self):
+        batch = [self.requests.get()]
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self.requests.get_nowait())
+            except queue.Empty:
+                break
+        if len(batch) > 1 or self.last_batch_size > 1:
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.requests.get(timeout=remaining))
+                except queue.Empty:
+                    break
+        self.last_batch_size = len(batch)
+        return batch
+
+    def __run(self):
+        while True:
+            batch = self.__collect()
+            items = [item for item, _ in batch]
+            futures = [future for _, future in batch]
+            try:
+                results = self.batch_fn(items)
+                if len(results) != len(items):
+                    raise RuntimeError('batch_fn returned %i results for %i items' % (len(results), len(items)))
+            except Exception as e:
+                logging.error('Batch of %i failed: %s' % (len(items), e))
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            for future, result in zip(futures, results):
+                future.set_result(result)
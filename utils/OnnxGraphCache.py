@@ -0,0 +1,98 @@
+"""Cache of ORT-optimized ONNX graphs, to skip graph optimization on restart.
+
+The first load runs ``ORT_ENABLE_ALL`` optimization as usual and saves the
+result (``SessionOptions.optimized_model_filepath``) next to the model as
+``<model>.<key>.opt.onnx``. Later loads read that file with optimization
+disabled. The key covers the model bytes, the onnxruntime version, the
+execution providers and the CPU architecture, since optimized graphs may
+contain provider- and hardware-specific nodes.
+"""
+import functools
+import glob
+import hashlib
+import logging
+import os
+import platform
+
+import onnxruntime
+
+
+def _hash_file(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@functools.lru_cache(maxsize=16)
+def _hash_model(path, mtime_ns, size):
+    # keyed on mtime and size, so every session of a pool hashes the model only once
+    return _hash_file(path)
+
+
+def _provider_names(providers):
+    return [p[0] if isinstance(p, (tuple, list)) else p for p in providers]
+
+
+def cache_key(model_path, providers):
+    stat = os.stat(model_path)
+    model_hash = _hash_model(os.path.abspath(model_path), stat.st_mtime_ns, stat.st_size)
+    parts = [model_hash, onnxruntime.__version__, platform.machine()] + _provider_names(providers)
+    return hashlib.sha256('|'.join(parts).encode()).hexdigest()[:16]
+
+
+def cache_path(model_path, providers):
+    stem, _ = os.path.splitext(model_path)
+    return '%s.%s.opt.onnx' % (stem, cache_key(model_path, providers))
+
+
+def _remove_stale(model_path, keep):
+    stem, _ = os.path.splitext(model_path)
+    # only keys of this model, not e.g. model.int8.<key>.opt.onnx of model.onnx
+    for path in glob.glob(glob.escape(stem) + '.' + '[0-9a-f]' * 16 + '.opt.onnx'):
+        if path != keep:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def load_session(model_path, providers, sess_options=None):
+    """Create an InferenceSession for ``model_path`` through the optimized-graph cache.
+
+    ``sess_options`` is used as given, except for the optimization level and
+    output path which are switched for the duration of the call.
+    """
+    sess_options = sess_options or onnxruntime.SessionOptions()
+    optimized_path = cache_path(model_path, providers)
+    level = sess_options.graph_optimization_level
+
+    if os.path.exists(optimized_path):
+        sess_options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL
+        try:
+            return onnxruntime.InferenceSession(optimized_path, sess_options=sess_options, providers=providers)
+        except Exception as e:
+            logging.warning('Cached optimized model %s failed to load, rebuilding: %s' % (optimized_path, e))
+        finally:
+            sess_options.graph_optimization_level = level
+
+    tmp_path = '%s.%i.tmp' % (optimized_path, os.getpid())
+    sess_options.optimized_model_filepath = tmp_path
+    try:
+        session = onnxruntime.InferenceSession(model_path, sess_options=sess_options, providers=providers)
+    except Exception as e:
+        # onnxruntime fails the whole session when it cannot write the optimized graph,
+        # e.g. a read-only model directory; load it uncached like before
+        logging.warning('Could not save optimized model next to %s, loading without cache: %s' % (model_path, e))
+        sess_options.optimized_model_filepath = ''
+        return onnxruntime.InferenceSession(model_path, sess_options=sess_options, providers=providers)
+    finally:
+        sess_options.optimized_model_filepath = ''
+    try:
+        os.replace(tmp_path, optimized_path)
+        _remove_stale(model_path, optimized_path)
+        logging.info('Saved optimized model to %s' % optimized_path)
+    except OSError as e:
+        logging.warning('Could not save optimized model next to %s: %s' % (model_path, e))
+    return session
@@ -0,0 +1,39 @@
+"""Dynamic INT8 variants of the ONNX models and the fp32/int8 precision switch.
+
+``quantize`` writes ``<model>.int8.onnx`` next to ``<model>.onnx``; loaders
+call ``model_for_precision`` to pick the file for the configured precision.
+Quantizing needs the ``onnx`` package, loading does not.
+"""
+import logging
+import os
+
+PRECISIONS = ('fp32', 'int8')
+
+
+def quantized_path(model_path):
+    stem, ext = os.path.splitext(model_path)
+    return '%s.int8%s' % (stem, ext)
+
+
+def model_for_precision(model_path, precision='fp32'):
+    if precision not in PRECISIONS:
+        raise ValueError('Unknown precision %s, expected one of %s' % (precision, PRECISIONS))
+    if precision == 'fp32':
+        return model_path
+    path = quantized_path(model_path)
+    if not os.path.exists(path):
+        raise FileNotFoundError('%s does not exist, create it with python -m examples.quantize_models' % path)
+    return path
+
+
+def quantize(model_path, output_path=None, per_channel=False):
+    """Dynamic quantization: int8 weights, activations quantized at run time."""
+    try:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+    except ImportError as e:
+        raise ImportError('Quantizing needs the onnx package: pip install onnx') from e
+    output_path = output_path or quantized_path(model_path)
+    quantize_dynamic(model_path, output_path, weight_type=QuantType.QInt8, per_channel=per_channel)
+    logging.info('Quantized %s (%.1f MB) to %s (%.1f MB)' % (
+        model_path, os.path.getsize(model_path) / 2 ** 20, output_path, os.path.getsize(output_path) / 2 ** 20))
+    return output_path
@@ -0,0 +1,106 @@
+import logging
+import queue
+import threading
+
+_DONE = object()
+
+
+class _Failed():
+    def __init__(self, error):
+        self.error = error
+
+
+class SentencePipeline():
+    """Overlaps LLM streaming, TTS and sending of a streamed reply.
+
+    Three stages connected by bounded queues::
+
+        reader thread  --text_queue-->  TTS thread  --audio_queue-->  caller thread (sender)
+
+    The reader keeps consuming the LLM stream while sentence N+1 is synthesized
+    and sentence N is sent. Sentiment for a sentence is submitted to
+    ``sentiment_pool`` when its TTS starts, so it runs alongside synthesis.
+    There is a single TTS worker and every queue is FIFO, so the output order
+    is the order the LLM produced the sentences in. An exception in any stage
+    stops the others and is re-raised from ``run``. Cancelling ``cancel_token``
+    makes ``run`` return at the next sentence boundary and drops queued audio.
+    """
+
+    def __init__(self, synthesize, sentiment, send, sentiment_pool, queue_size=2):
+        self.synthesize = synthesize
+        self.sentiment = sentiment
+        self.send = send
+        self.sentiment_pool = sentiment_pool
+        self.queue_size = queue_size
+
+    def run(self, sentences, cancel_token=None):
+        stop = threading.Event()
+        text_queue = queue.Queue(self.queue_size)
+        audio_queue = queue.Queue(self.queue_size)
+
+        def stopped():
+            return stop.is_set() or (cancel_token is not None and cancel_token.cancelled)
+
+        def put(q, item):
+            while not stopped():
+                try:
+                    q.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def read():
+            try:
+                for sentence in sentences:
+                    if not sentence.strip():
+                        continue
+                    if not put(text_queue, sentence):
+                        return
+                put(text_queue, _DONE)
+            except Exception as e:
+                put(text_queue, _Failed(e))
+
+        def synthesize():
+            try:
+                while True:
+                    sentence = text_queue.get()
+                    if sentence is _DONE or isinstance(sentence, _Failed):
+                        put(audio_queue, sentence)
+                        return
+                    if stopped():
+                        return
+                    senti = self.sentiment_pool.submit(self.sentiment, sentence)
+                    if not put(audio_queue, (sentence, self.synthesize(sentence), senti)):
+                        return
+            except Exception as e:
+                put(audio_queue, _Failed(e))
+
+        workers = [threading.Thread(target=read, daemon=True), threading.Thread(target=synthesize, daemon=True)]
+        for worker in workers:
+            worker.start()
+        try:
+            while True:
+                try:
+                    item = audio_queue.get(timeout=0.1)
+                except queue.Empty:
+                    if stopped():
+                        return
+                    continue
+                if stopped():
+                    logging.info('Pipeline cancelled, dropping queued audio.')
+                    return
+                if item is _DONE:
+                    return
+                if isinstance(item, _Failed):
+                    raise item.error
+                sentence, audio, senti = item
+                self.send(audio, senti.result())
+                logging.debug('Pipeline sent: %s' % sentence)
+        finally:
+            stop.set()
+            # unblock a TTS worker waiting for text so it can see the stop flag
+            try:
+                text_queue.put_nowait(_DONE)
+            except queue.Full:
+                pass
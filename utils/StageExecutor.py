@@ -0,0 +1,43 @@
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_WORKERS = {'asr': 1, 'llm': 4, 'tts': 1, 'sentiment': 1}
+
+
+class StageExecutor():
+    """Runs blocking model calls on one thread pool per pipeline stage.
+
+    Coroutines await the result instead of blocking the event loop. Each stage
+    accepts at most ``workers + queue_size`` calls at a time; further callers wait
+    on the stage semaphore, so a burst of clients cannot pile up unbounded work.
+    The models release the GIL inside onnxruntime/torch/numpy, which is why
+    threads rather than processes are used.
+    """
+
+    def __init__(self, workers=None, queue_size=8):
+        self.workers = dict(DEFAULT_WORKERS, **(workers or {}))
+        self.pools = {stage: ThreadPoolExecutor(max_workers=n, thread_name_prefix='stage-%s' % stage)
+                      for stage, n in self.workers.items()}
+        self.slots = {stage: asyncio.Semaphore(n + queue_size) for stage, n in self.workers.items()}
+        logging.info('Stage executor workers: %s, queue size %i' % (self.workers, queue_size))
+
+    async def run(self, stage, fn, *args, **kwargs):
+        async with self.slots[stage]:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.pools[stage], functools.partial(fn, *args, **kwargs))
+
+    async def iterate(self, stage, iterator):
+        """Drive a blocking iterator (e.g. ``GPTService.ask_stream``) on a stage pool."""
+        iterator = iter(iterator)
+        sentinel = object()
+        while True:
+            item = await self.run(stage, next, iterator, sentinel)
+            if item is sentinel:
+                return
+            yield item
+
+    def shutdown(self, wait=True):
+        for pool in self.pools.values():
+            pool.shutdown(wait=wait)
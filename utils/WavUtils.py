@@ -0,0 +1,75 @@
+"""In-memory WAV decoding for uploads received over the network.
+
+UE clients stream the WAV before they know its length, so the RIFF and data
+chunk sizes in the header are often zero or garbage. ``parse_wav`` ignores the
+RIFF size and treats the data chunk as running to the end of the buffer
+whenever its declared size does not fit.
+"""
+import struct
+
+import numpy as np
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+class WavFormatError(Exception):
+    pass
+
+
+def _decode_samples(raw, audio_format, bits):
+    if audio_format == WAVE_FORMAT_IEEE_FLOAT:
+        if bits not in (32, 64):
+            raise WavFormatError('Unsupported float WAV with %i bits.' % bits)
+        return np.frombuffer(raw, dtype='<f%i' % (bits // 8)).astype(np.float32)
+    if bits == 8:
+        return (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128) / 128
+    if bits == 16:
+        return np.frombuffer(raw, dtype='<i2').astype(np.float32) / (1 << 15)
+    if bits == 24:
+        b = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        samples = b[:, 0] | (b[:, 1] << 8) | (b[:, 2] << 16)
+        samples = np.where(samples >= 1 << 23, samples - (1 << 24), samples)
+        return samples.astype(np.float32) / (1 << 23)
+    if bits == 32:
+        return np.frombuffer(raw, dtype='<i4').astype(np.float32) / (1 << 31)
+    raise WavFormatError('Unsupported PCM WAV with %i bits.' % bits)
+
+
+def parse_wav(data):
+    """Decode WAV bytes into a float32 array of shape (channels, samples) and its sample rate."""
+    view = memoryview(data)
+    if len(view) < 12 or bytes(view[0:4]) != b'RIFF' or bytes(view[8:12]) != b'WAVE':
+        raise WavFormatError('Not a RIFF/WAVE buffer.')
+
+    fmt = None
+    pos = 12
+    while pos + 8 <= len(view):
+        chunk_id = bytes(view[pos:pos + 4])
+        chunk_size, = struct.unpack_from('<I', view, pos + 4)
+        body = pos + 8
+        if chunk_id == b'fmt ':
+            if chunk_size < 16 or body + 16 > len(view):
+                raise WavFormatError('Truncated fmt chunk.')
+            audio_format, channels, sample_rate, _, block_align, bits = struct.unpack_from('<HHIIHH', view, body)
+            if audio_format == WAVE_FORMAT_EXTENSIBLE and chunk_size >= 26 and body + 26 <= len(view):
+                audio_format, = struct.unpack_from('<H', view, body + 24)
+            if channels == 0 or block_align == 0:
+                raise WavFormatError('Invalid fmt chunk: %i channels, block align %i.' % (channels, block_align))
+            fmt = audio_format, channels, sample_rate, block_align, bits
+        elif chunk_id == b'data':
+            if fmt is None:
+                raise WavFormatError('data chunk before fmt chunk.')
+            audio_format, channels, sample_rate, block_align, bits = fmt
+            end = body + chunk_size
+            if chunk_size == 0 or end > len(view):
+                # size field was never patched by the client, take everything that arrived
+                end = len(view)
+            end -= (end - body) % block_align
+            samples = _decode_samples(view[body:end], audio_format, bits)
+            return samples.reshape(-1, channels).T, sample_rate
+        pos = body + chunk_size + (chunk_size & 1)
+
+    raise WavFormatError('No data chunk found.')
+